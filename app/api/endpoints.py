@@ -28,10 +28,13 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     logger.info(f"Uploaded {len(uploaded_files)} files: {uploaded_files}")
     
     # Process and Index
-    chunks = document_processor.process_documents(uploaded_files)
+    stats = {}
+    chunks = document_processor.process_documents(uploaded_files, stats)
     if chunks:
         faiss_service.add_documents(chunks)
         return UploadResponse(message="Documents indexed successfully", files=[f.filename for f in files])
+    elif stats.get("duplicates"):
+        return UploadResponse(message="Documents already indexed", files=[f.filename for f in files])
     else:
         raise HTTPException(status_code=400, detail="Failed to process documents.")
 
@@ -108,37 +111,71 @@ def rag_health():
 
     # Index size
     try:
-        index_size = 0
-        if faiss_service.vector_db and hasattr(faiss_service.vector_db, 'docstore'):
-            index_size = len(list(faiss_service.vector_db.docstore._dict.values()))
+        index_size = faiss_service.num_chunks
     except Exception:
         index_size = None
 
     # Vector store type
-    vector_store_type = 'FAISS' if faiss_service.vector_db else 'None'
-
-    # retriever_k and bm25_k
-    try:
-        bm25_k = faiss_service.bm25_retriever.k if faiss_service.bm25_retriever else None
-    except Exception:
-        bm25_k = None
-    # Our FAISS retriever default used in code is 50; attempt to reflect that as best-effort
-    retriever_k = 50
+    vector_store_type = 'None'
+    if faiss_service.segments:
+        from app.services.vector_index import index_kind, index_quantization
+        layouts = sorted({
+            f"{index_kind(segment.store.index)}, {index_quantization(segment.store.index)}"
+            for segment in faiss_service.segments
+        })
+        vector_store_type = f"FAISS ({'; '.join(layouts)})"
+
+    # Default candidate depth for a top-25 query; the actual depth scales with k
+    retriever = faiss_service.get_hybrid_retriever()
+    retriever_k = bm25_k = None
+    if retriever:
+        retriever_k, bm25_k = retriever.budget(25)
+        if not faiss_service.keyword_index:
+            bm25_k = None
+
+    from app.services.embedding_cache import QueryEmbeddingCache, embedding_cache
+    from app.services.executors import executor_stats
+    from app.services.query_scheduler import query_scheduler
+    from app.services.reranker import reranker
+    from app.services.answer_cache import answer_cache
+    from app.services.retrieval_cache import retrieval_cache
 
     system = collect_system_metrics()
 
     response = {
-        "status": "ok" if faiss_service.vector_db else "no_index",
+        "status": "ok" if faiss_service.segments else "no_index",
         "index_size": index_size or 0,
         "vector_store_type": vector_store_type,
+        "index_generation": faiss_service.generation,
+        "index_segments": len(faiss_service.segments),
+        "index_segments_mapped": sum(segment.mapped for segment in faiss_service.segments),
+        "index_tombstones": len(faiss_service.tombstones),
         "embedding_model_name": settings.EMBEDDING_MODEL,
+        "embedding_backend": faiss_service.embedding_backend,
         "avg_retrieval_time_ms": int((metrics.get('avg_retrieval_time') or 0) * 1000),
         "avg_rerank_time_ms": int((metrics.get('last_rerank_time') or 0) * 1000),
         "avg_generation_time_ms": int((metrics.get('avg_generation_time') or 0) * 1000),
+        "avg_rerank_depth": metrics.get('avg_rerank_depth'),
+        "avg_rerank_candidates": metrics.get('avg_rerank_candidates'),
+        "avg_rerank_time_saved_ms": round((metrics.get('avg_rerank_time_saved') or 0) * 1000, 2),
         "last_query_sources": metrics.get('last_retrieval_sources') or [],
         "last_docs_retrieved_count": metrics.get('last_retrieval_count') or 0,
         "retriever_k": retriever_k,
         "bm25_k": bm25_k,
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "query_embedding_cache": (
+            faiss_service.embeddings.stats() if isinstance(faiss_service.embeddings, QueryEmbeddingCache) else None
+        ),
+        "rerank_score_cache": reranker.score_cache_stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "retrieval_cache": {
+            **(retrieval_cache.stats() if retrieval_cache else {}),
+            "hits": metrics.get('retrieval_cache_hits'),
+            "misses": metrics.get('retrieval_cache_misses'),
+            "hit_rate": metrics.get('retrieval_cache_hit_rate'),
+        },
+        "stage_executors": executor_stats(),
+        "query_batching": query_scheduler.stats(),
         "debug_mode": bool(settings.DEBUG_RAG),
         "system_memory_usage_mb": system.get('system_memory_usage_mb'),
         "system_cpu_usage_percent": system.get('system_cpu_usage_percent'),
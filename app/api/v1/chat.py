@@ -1,7 +1,10 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.services.rag_pipeline import rag_retriever
-from app.services.llm_service import llm_service
+from app.services.llm_service import LLM_ERROR_PREFIX, llm_service
 from app.services.cache_service import cache_service
+from app.services.answer_cache import answer_cache, conversation_key
+from app.services.executors import search_executor
+from app.services.faiss_service import faiss_service
 from app.auth.jwt_handler import decode_access_token
 from loguru import logger
 import json
@@ -9,6 +12,23 @@ from app.core.config import settings
 
 router = APIRouter()
 
+# Words per chunk frame when replaying a cached answer
+REPLAY_WORDS = 8
+
+
+async def replay_answer(websocket: WebSocket, cached: dict):
+    """Sends a cached answer with the same frames as a generated one."""
+    if cached["sources"]:
+        await websocket.send_text(json.dumps({"type": "chunk", "content": "", "sources": cached["sources"]}))
+    # split(" ") keeps newlines and markdown intact when the pieces are joined back
+    words = cached["answer"].split(" ")
+    for start in range(0, len(words), REPLAY_WORDS):
+        piece = " ".join(words[start:start + REPLAY_WORDS])
+        if start + REPLAY_WORDS < len(words):
+            piece += " "
+        await websocket.send_text(json.dumps({"type": "chunk", "content": piece}))
+    await websocket.send_text(json.dumps({"type": "done", "cached": True}))
+
 @router.websocket("/ws/chat/{session_id}")
 async def websocket_chat(websocket: WebSocket, session_id: str, token: str = None):
     # Verify token
@@ -37,6 +57,26 @@ async def websocket_chat(websocket: WebSocket, session_id: str, token: str = Non
             except Exception as e:
                 logger.error(f"History fetch failed: {e}")
                 history = []
+
+            # Answer cache: a near-identical question against the same index generation
+            generation = await search_executor.run(faiss_service.latest_generation)
+            # Keyed by role and recent history as well: follow-ups only make sense in their own conversation
+            conversation = conversation_key(role, history)
+            cached = None
+            if answer_cache and generation is not None:
+                try:
+                    cached = await search_executor.run(answer_cache.lookup, query, conversation, generation)
+                except Exception as e:
+                    logger.error(f"Answer cache lookup failed: {e}")
+            if cached:
+                logger.info(f"Serving cached answer for session {session_id}.")
+                await replay_answer(websocket, cached)
+                try:
+                    cache_service.add_to_history(session_id, "user", query)
+                    cache_service.add_to_history(session_id, "assistant", cached["answer"])
+                except Exception as e:
+                    logger.error(f"History save failed: {e}")
+                continue
             
             # 2. Retrieve Context (with hybrid search and reranking)
             logger.debug("Retrieving context...")
@@ -150,6 +190,15 @@ async def websocket_chat(websocket: WebSocket, session_id: str, token: str = Non
             
             # 4. Finalize & Save History
             await websocket.send_text(json.dumps({"type": "done"}))
+            # The error text may follow part of an answer, so look for it anywhere
+            if (
+                answer_cache and generation is not None
+                and full_response.strip() and LLM_ERROR_PREFIX not in full_response
+            ):
+                try:
+                    await search_executor.run(answer_cache.store, query, conversation, generation, full_response, sources)
+                except Exception as e:
+                    logger.error(f"Answer cache store failed: {e}")
             try:
                 cache_service.add_to_history(session_id, "user", query)
                 cache_service.add_to_history(session_id, "assistant", full_response)
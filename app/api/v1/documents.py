@@ -1,4 +1,5 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from app.services.document_processor import document_processor
 from app.services.faiss_service import faiss_service
@@ -27,11 +28,23 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     
     # Use the new document_processor which has OCR and metadata enrichment
     try:
-        chunks = document_processor.process_documents(uploaded_paths)
+        # Off the event loop, so concurrent uploads overlap and are group-committed
+        stats = {}
+        chunks = await run_in_threadpool(document_processor.process_documents, uploaded_paths, stats)
         if chunks:
             # Use the new faiss_service which has BM25 and Hybrid Search
-            faiss_service.add_documents(chunks)
-            return {"message": "Files indexed successfully", "files": [f.filename for f in files]}
+            await run_in_threadpool(faiss_service.add_documents, chunks)
+            return {
+                "message": "Files indexed successfully",
+                "files": [f.filename for f in files],
+                "duplicates_skipped": stats.get("duplicates", 0),
+            }
+        elif stats.get("duplicates"):
+            return {
+                "message": "Files already indexed; all chunks were duplicates of existing content",
+                "files": [f.filename for f in files],
+                "duplicates_skipped": stats["duplicates"],
+            }
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, 
@@ -26,7 +26,103 @@ class Settings(BaseSettings):
     GROQ_API_KEY: str
     MODEL_NAME: str = "llama3-70b-8192"
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    # "torch" (sentence-transformers) or "onnx" (ONNX Runtime; the model is exported
+    # once to EMBEDDING_ONNX_DIR, default onnx/ next to INDEX_PATH). EMBEDDING_QUANTIZE
+    # serves the dynamically int8-quantized graph instead; its vectors drift slightly
+    # from the float32 ones already in the index.
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_QUANTIZE: bool = False
+    EMBEDDING_ONNX_DIR: str = ""
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_THREADS: int = 0  # 0 = runtime default (all cores)
+    RERANK_BATCH_SIZE: int = 64  # (query, chunk) pairs per reranker forward pass
+    RERANK_SCORE_CACHE_SIZE: int = 50000  # cached (query, chunk) reranker scores; 0 disables
+    # Rerank cascade: only candidates whose normalized fused score is within the
+    # margin of the top_n-th are reranked, in steps, until the top_n stops changing
+    RERANK_CASCADE: bool = True
+    RERANK_CASCADE_MARGIN: float = 0.35
+    RERANK_CASCADE_STEP: int = 16
+    # Chat retrieval runs off the event loop: threads for embed + search and for
+    # reranking, and how many more calls may queue behind each before callers wait
+    SEARCH_STAGE_THREADS: int = 4
+    RERANK_STAGE_THREADS: int = 2
+    STAGE_MAX_PENDING: int = 32
+    # Concurrent searches / reranks arriving within this window (ms) are run as one
+    # batch of at most QUERY_BATCH_MAX queries
+    QUERY_BATCH_WINDOW_MS: float = 3.0
+    QUERY_BATCH_MAX: int = 16
     DEBUG_RAG: bool = False
+    HYBRID_FUSION: str = "rrf"  # "rrf" (weighted reciprocal rank) or "score" (normalized score sum)
+    # Candidate budget: FAISS/BM25 depth = k * factor, clamped to [min, max]
+    RETRIEVAL_DEPTH_FACTOR: int = 2
+    RETRIEVAL_MIN_DEPTH: int = 20
+    RETRIEVAL_MAX_DEPTH: int = 200
+
+    # Vector index: "flat" (exact), "hnsw" or "ivf". Non-flat types only kick in
+    # once the corpus reaches VECTOR_INDEX_MIGRATE_AT live chunks across all segments;
+    # below that every segment stays flat, above it every segment is rebuilt in the new layout.
+    VECTOR_INDEX_TYPE: str = "flat"
+    VECTOR_INDEX_MIGRATE_AT: int = 50000
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    IVF_NLIST: int = 0  # 0 = 4 * sqrt(chunk count)
+    IVF_NPROBE: int = 16
+    # Vector codec applied at the same corpus threshold: "none" (float32), "fp16", "sq8" or "pq";
+    # PQ needs 2 ** PQ_NBITS vectors to train, so smaller segments keep float32.
+    # VECTOR_RERANK_EXACT keeps a float32 copy to re-rank the top k * factor candidates
+    # exactly; turn it off to get the full memory saving.
+    VECTOR_QUANTIZATION: str = "none"
+    PQ_M: int = 16  # sub-quantizers; must divide the embedding dimension (384 for MiniLM)
+    PQ_NBITS: int = 8
+    VECTOR_RERANK_EXACT: bool = True
+    VECTOR_RERANK_FACTOR: int = 4
+    # Map index.faiss read-only so uvicorn workers share one copy in the page cache
+    FAISS_MMAP: bool = True
+    # Segmented index: each upload becomes a small immutable segment; a background
+    # compactor merges them once there are more than SEGMENT_MAX_COUNT, and rewrites
+    # any segment whose share of deleted chunks exceeds SEGMENT_TOMBSTONE_RATIO
+    SEGMENT_MAX_COUNT: int = 8
+    SEGMENT_TOMBSTONE_RATIO: float = 0.3
+    # Compaction stops growing a segment once it holds an even share of the corpus per
+    # search fan-out thread, so large corpora stay split into at least one shard per
+    # thread, searched in parallel. Shards never go below SEGMENT_SHARD_MIN_CHUNKS
+    # (smaller ones search too fast to gain from fan-out) or above SEGMENT_MAX_CHUNKS.
+    SEGMENT_SHARD_MIN_CHUNKS: int = 20000
+    SEGMENT_MAX_CHUNKS: int = 200000
+    # Threads for the per-query shard fan-out (0 = one per CPU core)
+    SEARCH_FANOUT_THREADS: int = 0
+    # Filtered searches score up to this many matching chunks per segment directly;
+    # larger subsets go through the ANN index with an id selector
+    FILTER_EXACT_MAX_CHUNKS: int = 20000
+    # Seconds between checks of manifest.json for commits by other workers (0 = every query)
+    INDEX_RELOAD_INTERVAL: float = 1.0
+    # On-disk embedding cache keyed by (model, sha256 of chunk text); 0 disables it.
+    # Defaults to embedding_cache.sqlite3 next to INDEX_PATH.
+    EMBEDDING_CACHE_MB: int = 1024
+    EMBEDDING_CACHE_PATH: str = ""
+    # In-process LRU of query text -> vector (0 disables it); QUERY_EMBEDDING_REDIS adds
+    # a Redis tier shared by all workers, entries expiring after QUERY_EMBEDDING_TTL seconds
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096
+    QUERY_EMBEDDING_REDIS: bool = False
+    QUERY_EMBEDDING_TTL: int = 86400
+    # Semantic answer cache: a question whose embedding is within ANSWER_CACHE_THRESHOLD
+    # (cosine) of an earlier one with the same role and recent history, on the same
+    # index generation, is answered from cache; kept in Redis when available, else in process
+    ANSWER_CACHE: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 200  # in process in total; in Redis per conversation state
+    ANSWER_CACHE_TTL: int = 3600
+    # Ranked chunk ids per (normalized query, intent) on the current index generation
+    RETRIEVAL_CACHE_SIZE: int = 2048  # 0 disables it
+    RETRIEVAL_CACHE_TTL: int = 900
+    # Ingest-time deduplication: exact (normalized SHA-256) duplicates, plus MinHash
+    # near-duplicates at or above DEDUP_THRESHOLD estimated Jaccard similarity when it is
+    # below 1.0. Near matching drops chunks that differ in a few words (the same resume
+    # template with another name), and those words are then not searchable, so it is off
+    # by default. Signatures live in dedup.sqlite3 next to INDEX_PATH
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 1.0
     TEXT_ONLY_MODE: bool = False
 
     # Paths
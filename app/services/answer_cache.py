@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from loguru import logger
+from app.core.config import settings
+from app.services.llm_service import PROMPT_HISTORY_TURNS
+
+
+def conversation_key(role: str, history: List[dict]) -> str:
+    """Digest of everything besides the question that goes into the prompt:
+    the role and the recent chat history."""
+    recent = [[message.get("role"), message.get("content")] for message in history[-PROMPT_HISTORY_TURNS:]]
+    return hashlib.sha256(json.dumps([role, recent]).encode("utf-8")).hexdigest()[:32]
+
+
+class SemanticAnswerCache:
+    """Generated answers, reused for questions within `threshold` cosine similarity in the same conversation state."""
+
+    def __init__(self, embeddings, model: str, threshold: float, max_entries: int, ttl: int, redis_cache=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.redis_cache = redis_cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        # Local fallback: conversation key -> entries, least recently stored first
+        self._entries: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._size = 0
+
+    def _prefix(self, generation: int) -> str:
+        return f"answers:{self.model}:{generation}:"
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_generation(self, generation: int):
+        """Forgets the entries of an older index generation."""
+        with self._lock:
+            if self._generation == generation:
+                return
+            previous, self._generation = self._generation, generation
+            self._entries.clear()
+            self._size = 0
+        if previous is None:
+            return
+        if self.redis_cache is not None:
+            try:
+                self.redis_cache.delete_cache_prefix(self._prefix(previous))
+            except Exception as e:
+                logger.debug(f"Answer cache invalidation in Redis failed: {e}")
+        logger.info(f"Answer cache invalidated: index generation {previous} -> {generation}.")
+
+    def lookup(self, query: str, conversation: str, generation: int) -> Optional[Dict[str, Any]]:
+        """The cached {"answer", "sources"} for `query` in `conversation`, or None."""
+        self._sync_generation(generation)
+        if self.redis_cache is None:
+            with self._lock:
+                entries = list(self._entries.get(conversation, ()))
+            candidates = [(entry["vector"], entry) for entry in entries]
+        else:
+            candidates = self._redis_candidates(conversation, generation)
+
+        best = None
+        if candidates:
+            vector = self._embed(query)
+            similarities = np.stack([v for v, _ in candidates]) @ vector
+            i = int(np.argmax(similarities))
+            if similarities[i] >= self.threshold:
+                best = candidates[i][1]
+                if self.redis_cache is not None:
+                    best = self._redis_answer(conversation, generation, best)
+                if best is not None:
+                    logger.debug(f"Answer cache hit (similarity {similarities[i]:.3f}) for: {query}")
+        with self._lock:
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {"answer": best["answer"], "sources": best["sources"]}
+
+    def store(self, query: str, conversation: str, generation: int, answer: str, sources: List[Dict[str, Any]]):
+        self._sync_generation(generation)
+        vector = self._embed(query)
+        if self.redis_cache is None:
+            with self._lock:
+                if self._generation != generation:
+                    return
+                self._entries.setdefault(conversation, []).append(
+                    {"vector": vector, "answer": answer, "sources": sources}
+                )
+                self._entries.move_to_end(conversation)
+                self._size += 1
+                while self._size > self.max_entries:
+                    _, dropped = self._entries.popitem(last=False)
+                    self._size -= len(dropped)
+            return
+
+        # Ids sort by creation time, so the oldest entries are trimmed first
+        entry_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        key = self._prefix(generation) + conversation
+        try:
+            self.redis_cache.set_cache(
+                f"{key}:{entry_id}", json.dumps({"answer": answer, "sources": sources}), expire=self.ttl
+            )
+            self.redis_cache.set_cache_field(
+                key, entry_id, base64.b64encode(vector.tobytes()).decode("ascii"), expire=self.ttl
+            )
+        except Exception as e:
+            logger.debug(f"Answer cache store in Redis failed: {e}")
+
+    def _redis_candidates(self, conversation: str, generation: int) -> List[Any]:
+        # One hash per conversation state: entry id -> question vector; answers live under their own keys
+        key = self._prefix(generation) + conversation
+        try:
+            fields = self.redis_cache.get_cache_fields(key)
+        except Exception as e:
+            logger.debug(f"Answer cache lookup in Redis failed: {e}")
+            return []
+        ids = sorted(fields)
+        if len(ids) > self.max_entries:
+            stale, ids = ids[:-self.max_entries], ids[-self.max_entries:]
+            try:
+                self.redis_cache.delete_cache_fields(key, stale)
+                for entry_id in stale:
+                    self.redis_cache.delete_cache(f"{key}:{entry_id}")
+            except Exception as e:
+                logger.debug(f"Answer cache trim in Redis failed: {e}")
+        return [(np.frombuffer(base64.b64decode(fields[entry_id]), dtype=np.float32), entry_id) for entry_id in ids]
+
+    def _redis_answer(self, conversation: str, generation: int, entry_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.redis_cache.get_cache(f"{self._prefix(generation)}{conversation}:{entry_id}")
+        except Exception as e:
+            logger.debug(f"Answer cache lookup in Redis failed: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis" if self.redis_cache is not None else "local",
+                "generation": self._generation,
+                "local_entries": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+def _create_answer_cache() -> Optional[SemanticAnswerCache]:
+    if not settings.ANSWER_CACHE:
+        return None
+    from app.services.cache_service import cache_service
+    from app.services.faiss_service import faiss_service
+    return SemanticAnswerCache(
+        faiss_service.embeddings,
+        faiss_service.embedding_model_key,
+        settings.ANSWER_CACHE_THRESHOLD,
+        settings.ANSWER_CACHE_MAX_ENTRIES,
+        settings.ANSWER_CACHE_TTL,
+        cache_service if cache_service.redis else None,
+    )
+
+
+answer_cache = _create_answer_cache()
@@ -38,4 +38,30 @@ class CacheService:
             return self.redis.get(f"cache:{key}")
         return None
 
+    def delete_cache(self, key: str):
+        if self.redis:
+            self.redis.delete(f"cache:{key}")
+
+    def set_cache_field(self, key: str, field: str, value: str, expire: int = 3600):
+        if self.redis:
+            pipe = self.redis.pipeline()
+            pipe.hset(f"cache:{key}", field, value)
+            pipe.expire(f"cache:{key}", expire)
+            pipe.execute()
+
+    def get_cache_fields(self, key: str) -> dict:
+        if self.redis:
+            return self.redis.hgetall(f"cache:{key}")
+        return {}
+
+    def delete_cache_fields(self, key: str, fields: list):
+        if self.redis and fields:
+            self.redis.hdel(f"cache:{key}", *fields)
+
+    def delete_cache_prefix(self, prefix: str):
+        if self.redis:
+            keys = list(self.redis.scan_iter(match=f"cache:{prefix}*", count=500))
+            if keys:
+                self.redis.delete(*keys)
+
 cache_service = CacheService()
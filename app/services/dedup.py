@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from loguru import logger
+from app.core.config import settings
+
+_WORD_RE = re.compile(r"\w+")
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs above ~0.8 Jaccard almost always share a bucket
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1)
+# Fixed seed: signatures are persisted and must be comparable across runs
+_PERM_A = _rng.randint(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the normalized text; equal for chunks that differ only in case,
+    whitespace or punctuation."""
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) over word 5-shingles."""
+    words = normalize(text).split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    values = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    with np.errstate(over="ignore"):
+        hashed = (np.outer(values, _PERM_A) + _PERM_B) % _PRIME
+    return (hashed & np.uint64(0xFFFFFFFF)).min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """One LSH bucket per band; signatures that share any bucket are candidates."""
+    return [
+        int.from_bytes(hashlib.blake2b(signature[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=7).digest(), "little")
+        for b in range(BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+class Deduplicator:
+    """Drops exact (SHA-256) and, below a threshold of 1, near (MinHash + LSH) duplicate
+    chunks against the whole corpus."""
+
+    def __init__(self, path: str, threshold: float):
+        self.threshold = threshold
+        # Signatures are still recorded at 1.0, so near matching can be turned on later
+        self.near = threshold < 1.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            " chunk_id TEXT PRIMARY KEY, file_name TEXT, exact TEXT NOT NULL, minhash BLOB NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS signatures_exact ON signatures (exact);"
+            "CREATE INDEX IF NOT EXISTS signatures_file ON signatures (file_name);"
+            "CREATE TABLE IF NOT EXISTS lsh ("
+            " band INTEGER, bucket INTEGER, chunk_id TEXT, PRIMARY KEY (band, bucket, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS lsh_chunk ON lsh (chunk_id);"
+            # Chunks dropped from file_name because they duplicated chunk_id; `document`
+            # is the dropped chunk itself (JSON), indexed again if chunk_id is deleted
+            "CREATE TABLE IF NOT EXISTS duplicates (file_name TEXT, chunk_id TEXT, document TEXT);"
+            "CREATE INDEX IF NOT EXISTS duplicates_chunk ON duplicates (chunk_id);"
+            "CREATE INDEX IF NOT EXISTS duplicates_file ON duplicates (file_name);"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(duplicates)")}
+        if "document" not in columns:
+            self._db.execute("ALTER TABLE duplicates ADD COLUMN document TEXT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def _match_indexed(self, exact: str, signature: np.ndarray, buckets: List[int]) -> Optional[str]:
+        row = self._db.execute("SELECT chunk_id FROM signatures WHERE exact = ? LIMIT 1", (exact,)).fetchone()
+        if row or not self.near:
+            return row[0] if row else None
+        candidates = self._db.execute(
+            "SELECT DISTINCT s.chunk_id, s.minhash FROM lsh JOIN signatures s ON s.chunk_id = lsh.chunk_id"
+            f" WHERE {' OR '.join('(lsh.band = ? AND lsh.bucket = ?)' for _ in buckets)}",
+            [value for band, bucket in enumerate(buckets) for value in (band, bucket)],
+        ).fetchall()
+        for chunk_id, blob in candidates:
+            if similarity(signature, np.frombuffer(blob, dtype=np.uint32)) >= self.threshold:
+                return chunk_id
+        return None
+
+    def filter(self, chunks: List[Document]) -> Tuple[List[Document], int]:
+        """Returns (chunks to index, number dropped as duplicates).
+
+        Kept chunks get a `content_hash` metadata entry. Duplicates within
+        the batch are resolved in favour of the first occurrence.
+        """
+        kept: List[Document] = []
+        batch_exact: Dict[str, str] = {}
+        batch_buckets: Dict[Tuple[int, int], List[int]] = {}
+        batch_signatures: List[np.ndarray] = []
+        duplicates: List[Tuple[str, str, str]] = []
+
+        with self._lock:
+            for chunk in chunks:
+                exact = content_hash(chunk.page_content)
+                signature = minhash(chunk.page_content)
+                buckets = band_keys(signature)
+
+                match = batch_exact.get(exact)
+                if match is None and self.near:
+                    seen = {i for band, bucket in enumerate(buckets) for i in batch_buckets.get((band, bucket), ())}
+                    match = next(
+                        (kept[i].metadata["chunk_id"] for i in sorted(seen)
+                         if similarity(signature, batch_signatures[i]) >= self.threshold),
+                        None,
+                    )
+                if match is None:
+                    match = self._match_indexed(exact, signature, buckets)
+                if match is not None:
+                    document = json.dumps({"page_content": chunk.page_content, "metadata": chunk.metadata}, default=str)
+                    duplicates.append((chunk.metadata.get("file_name"), match, document))
+                    continue
+
+                chunk.metadata["content_hash"] = exact
+                batch_exact[exact] = chunk.metadata["chunk_id"]
+                for band, bucket in enumerate(buckets):
+                    batch_buckets.setdefault((band, bucket), []).append(len(kept))
+                batch_signatures.append(signature)
+                kept.append(chunk)
+
+            if duplicates:
+                self._db.executemany("INSERT INTO duplicates VALUES (?, ?, ?)", duplicates)
+        return kept, len(duplicates)
+
+    def register(self, ids: Sequence[str], chunks: Sequence[Document]):
+        """Records the signatures of chunks that were just indexed under `ids`."""
+        rows, lsh_rows = [], []
+        for doc_id, chunk in zip(ids, chunks):
+            signature = minhash(chunk.page_content)
+            exact = chunk.metadata.get("content_hash") or content_hash(chunk.page_content)
+            rows.append((doc_id, chunk.metadata.get("file_name"), exact, signature.tobytes()))
+            lsh_rows.extend((band, bucket, doc_id) for band, bucket in enumerate(band_keys(signature)))
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?, ?, ?)", rows)
+                self._db.executemany("INSERT OR IGNORE INTO lsh VALUES (?, ?, ?)", lsh_rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def files(self) -> Set[str]:
+        """Files that hold deduplicated chunks, and may hold nothing else."""
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT DISTINCT file_name FROM duplicates")}
+
+    def shared_chunks(self, file_names: Iterable[str]) -> List[str]:
+        """Ids of the indexed chunks that stand in for the named files' duplicates."""
+        file_names = list(file_names)
+        if not file_names:
+            return []
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                f"SELECT DISTINCT chunk_id FROM duplicates WHERE file_name IN ({','.join('?' * len(file_names))})",
+                file_names,
+            )]
+
+    def forget_file(self, file_name: str, ids: Iterable[str]) -> Tuple[List[Document], int]:
+        """Drops the signatures of a deleted file's chunks and its own duplicate references.
+
+        Returns (chunks of other files that were dropped as duplicates of
+        these and now have to be indexed, number of references the file
+        itself held). The returned chunks should go through filter() again,
+        so several copies of the same text come back as one.
+        """
+        ids = list(ids)
+        orphans: List[Tuple[str, Optional[str]]] = []
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                references = self._db.execute(
+                    "DELETE FROM duplicates WHERE file_name = ?", (file_name,)
+                ).rowcount
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    marks = ",".join("?" * len(batch))
+                    orphans.extend(self._db.execute(
+                        f"SELECT file_name, document FROM duplicates WHERE chunk_id IN ({marks})", batch
+                    ))
+                    self._db.execute(f"DELETE FROM signatures WHERE chunk_id IN ({marks})", batch)
+                    self._db.execute(f"DELETE FROM lsh WHERE chunk_id IN ({marks})", batch)
+                    self._db.execute(f"DELETE FROM duplicates WHERE chunk_id IN ({marks})", batch)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        revived = []
+        for _, document in orphans:
+            if document:
+                data = json.loads(document)
+                revived.append(Document(page_content=data["page_content"], metadata=data["metadata"]))
+        lost = sorted({name for name, document in orphans if not document})
+        if lost:
+            # References recorded before dropped chunks were kept
+            logger.warning(
+                f"Deleted {file_name} held chunks that were deduplicated out of {lost}; "
+                "re-upload those files to index that text again."
+            )
+        return revived, references
+
+
+def _open_deduplicator() -> Optional[Deduplicator]:
+    if not settings.DEDUP_ENABLED:
+        return None
+    path = os.path.join(os.path.dirname(settings.INDEX_PATH) or ".", "dedup.sqlite3")
+    try:
+        return Deduplicator(path, settings.DEDUP_THRESHOLD)
+    except Exception as e:
+        logger.warning(f"Chunk deduplication unavailable ({path}): {e}")
+        return None
+
+
+deduplicator = _open_deduplicator()
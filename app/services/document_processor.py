@@ -1,7 +1,7 @@
 import os
 import time
 import json
-from typing import List
+from typing import Dict, List, Optional
 import pandas as pd
 import nbformat
 from bs4 import BeautifulSoup
@@ -10,6 +10,7 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from loguru import logger
 from app.core.config import settings
+from app.services.dedup import deduplicator
 
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 300):
@@ -287,8 +288,14 @@ class DocumentProcessor:
                 raise e # Propagate configuration errors to the UI
             return []
 
-    def process_documents(self, file_paths: List[str]) -> List[Document]:
-        """Processes multiple documents and returns enriched chunks."""
+    def process_documents(self, file_paths: List[str], stats: Optional[Dict[str, int]] = None) -> List[Document]:
+        """Processes multiple documents and returns enriched chunks.
+
+        Chunks that exactly or nearly duplicate one already indexed (or an
+        earlier one in this batch) are dropped before they reach the
+        embedding model. Pass a dict as `stats` to receive the chunk and
+        duplicate counts.
+        """
         all_docs = []
         for path in file_paths:
             docs = self.load_document(path)
@@ -305,8 +312,14 @@ class DocumentProcessor:
         for i, chunk in enumerate(chunks):
             chunk.metadata["chunk_id"] = str(uuid.uuid4())
             chunk.metadata["chunk_index"] = i
+
+        duplicates = 0
+        if deduplicator is not None:
+            chunks, duplicates = deduplicator.filter(chunks)
+        if stats is not None:
+            stats.update(chunks=len(chunks), duplicates=duplicates)
             
-        logger.info(f"Created {len(chunks)} chunks from {len(file_paths)} files.")
+        logger.info(f"Created {len(chunks)} chunks from {len(file_paths)} files ({duplicates} duplicates skipped).")
         
         return chunks
 
@@ -0,0 +1,286 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from app.core.config import settings
+
+
+def content_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent LRU of chunk embeddings keyed by (model, SHA-256 of the text), shared by all workers."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector for each text, or None where it has not been embedded before."""
+        keys = [content_key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+            if found:
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                    [(now, model, key) for key in found],
+                )
+            results = [found.get(key) for key in keys]
+            hits = sum(vector is not None for vector in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        now = time.time()
+        rows = [
+            (model, content_key(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for row in rows:
+                    cursor = self._db.execute("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", row)
+                    if cursor.rowcount:
+                        self._bytes += len(row[2])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drops least recently used rows until the cache is at 90% of its budget."""
+        # Other workers write to the same file, so re-measure before evicting
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._bytes > target:
+            rows = self._db.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            freed, batch = 0, []
+            for rowid, size in rows:
+                if self._bytes - freed <= target:
+                    break
+                batch.append((rowid,))
+                freed += size
+            self._db.executemany("DELETE FROM embeddings WHERE rowid = ?", batch)
+            self._bytes -= freed
+            evicted += len(batch)
+        self.evictions += evicted
+        if evicted:
+            logger.info(f"Embedding cache evicted {evicted} entries ({self._bytes / 2 ** 20:.0f} MB kept).")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size_mb": round(self._bytes / 2 ** 20, 1),
+            }
+
+
+def embed_documents_cached(embeddings, model: str, texts: List[str], cache: Optional[EmbeddingCache]) -> np.ndarray:
+    """Embeds `texts`, running the model only on texts the cache has not seen."""
+    if cache is None:
+        return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+
+    cached = cache.get_many(model, texts)
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        # Duplicate texts within the batch are embedded once
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        fresh = embeddings.embed_documents(unique)
+        cache.put_many(model, unique, fresh)
+        by_text = dict(zip(unique, fresh))
+        for i in missing:
+            cached[i] = np.asarray(by_text[texts[i]], dtype=np.float32)
+    logger.debug(f"Embedded {len(texts)} chunks: {len(texts) - len(missing)} from cache, {len(missing)} computed.")
+    return np.vstack(cached) if cached else np.empty((0, 0), dtype=np.float32)
+
+
+def normalize_query(text: str) -> str:
+    """Unicode- and whitespace-normalized query text; case is kept, since cased
+    models embed "Apple" and "apple" differently."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class QueryEmbeddingCache(Embeddings):
+    """Embeddings wrapper that memoizes embed_query in process and, optionally, in Redis."""
+
+    def __init__(self, embeddings: Embeddings, model: str, capacity: int, redis_cache=None, ttl: int = 86400):
+        self.embeddings = embeddings
+        self.model = model
+        self.capacity = capacity
+        self.redis_cache = redis_cache
+        self.ttl = ttl
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+        redis_key = f"qemb:{self.model}:{content_key(key)}"
+        vector = self._redis_get(redis_key)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(key), dtype=np.float32)
+            self._redis_set(redis_key, vector)
+            counter = "misses"
+        else:
+            counter = "redis_hits"
+
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.capacity:
+                self._vectors.popitem(last=False)
+        return vector.tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_query for several texts; the ones not cached are embedded in one model call."""
+        keys = [normalize_query(text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._vectors.get(key)
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+                    self.hits += 1
+                    vectors[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        redis_hits = 0
+        for key in list(missing):
+            vector = self._redis_get(f"qemb:{self.model}:{content_key(key)}")
+            if vector is not None:
+                vectors[key] = vector
+                missing.remove(key)
+                redis_hits += 1
+        if missing:
+            fresh = self.embeddings.embed_documents(missing)
+            for key, vector in zip(missing, fresh):
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+                self._redis_set(f"qemb:{self.model}:{content_key(key)}", vectors[key])
+
+        with self._lock:
+            self.redis_hits += redis_hits
+            self.misses += len(missing)
+            for key in dict.fromkeys(keys):
+                self._vectors[key] = vectors[key]
+                self._vectors.move_to_end(key)
+            while len(self._vectors) > self.capacity:
+                self._vectors.popitem(last=False)
+        return [vectors[key].tolist() for key in keys]
+
+    def _redis_get(self, key: str) -> Optional[np.ndarray]:
+        if self.redis_cache is None:
+            return None
+        try:
+            value = self.redis_cache.get_cache(key)
+        except Exception as e:
+            logger.debug(f"Query embedding lookup in Redis failed: {e}")
+            return None
+        return np.frombuffer(base64.b64decode(value), dtype=np.float32) if value else None
+
+    def _redis_set(self, key: str, vector: np.ndarray):
+        if self.redis_cache is None:
+            return
+        try:
+            self.redis_cache.set_cache(key, base64.b64encode(vector.tobytes()).decode("ascii"), expire=self.ttl)
+        except Exception as e:
+            logger.debug(f"Query embedding store in Redis failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                "size": len(self._vectors),
+            }
+
+
+def cache_query_embeddings(embeddings: Embeddings, model: str) -> Embeddings:
+    """Wraps `embeddings` in a QueryEmbeddingCache unless it is disabled."""
+    if not settings.QUERY_EMBEDDING_CACHE_SIZE:
+        return embeddings
+    redis_cache = None
+    if settings.QUERY_EMBEDDING_REDIS:
+        from app.services.cache_service import cache_service
+        redis_cache = cache_service if cache_service.redis else None
+    return QueryEmbeddingCache(
+        embeddings, model, settings.QUERY_EMBEDDING_CACHE_SIZE, redis_cache, settings.QUERY_EMBEDDING_TTL
+    )
+
+
+def _open_cache() -> Optional[EmbeddingCache]:
+    if not settings.EMBEDDING_CACHE_MB:
+        return None
+    path = settings.EMBEDDING_CACHE_PATH or os.path.join(os.path.dirname(settings.INDEX_PATH) or ".", "embedding_cache.sqlite3")
+    try:
+        return EmbeddingCache(path, settings.EMBEDDING_CACHE_MB * 2 ** 20)
+    except Exception as e:
+        logger.warning(f"Embedding cache unavailable ({path}): {e}")
+        return None
+
+
+embedding_cache = _open_cache()
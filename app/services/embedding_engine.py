@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Dict, List
+import numpy as np
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from app.core.config import settings
+
+BACKENDS = ("torch", "onnx")
+ONNX_META = "meta.json"
+
+
+def model_key(embeddings: Embeddings) -> str:
+    """Name the embedding cache stores this engine's vectors under.
+
+    The float32 ONNX export computes the same vectors as PyTorch (within
+    rounding), so both share cache entries; int8 vectors are kept apart.
+    """
+    if isinstance(embeddings, OnnxEmbeddings) and embeddings.quantized:
+        return f"{settings.EMBEDDING_MODEL}:onnx-int8"
+    return settings.EMBEDDING_MODEL
+
+
+def backend_name(embeddings: Embeddings) -> str:
+    if isinstance(embeddings, OnnxEmbeddings):
+        return "onnx-int8" if embeddings.quantized else "onnx"
+    return "torch"
+
+
+def _length_buckets(lengths: List[int], batch_size: int) -> List[List[int]]:
+    """Positions grouped into batches of similar token length, so each batch pads
+    to little more than its own longest text."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformers model exported by export_onnx, served by ONNX Runtime on the CPU."""
+
+    def __init__(self, model_dir: str, batch_size: int, threads: int = 0, quantized: bool = False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_META), "r", encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.batch_size = max(1, batch_size)
+        self.quantized = quantized
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(self.meta["max_length"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        model_file = "model.int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(texts)
+        out: List[np.ndarray] = [None] * len(texts)
+        for batch in _length_buckets([len(e.ids) for e in encodings], self.batch_size):
+            width = max(len(encodings[i].ids) for i in batch)
+            input_ids = np.full((len(batch), width), self.meta["pad_id"], dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            token_type_ids = np.zeros((len(batch), width), dtype=np.int64)
+            for row, i in enumerate(batch):
+                n = len(encodings[i].ids)
+                input_ids[row, :n] = encodings[i].ids
+                attention_mask[row, :n] = 1
+                token_type_ids[row, :n] = encodings[i].type_ids
+            feed = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+            hidden = self.session.run(None, {name: feed[name] for name in self._inputs})[0]
+
+            if self.meta["pooling"] == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = attention_mask[:, :, None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.meta["normalize"]:
+                pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            for row, i in enumerate(batch):
+                out[i] = pooled[row]
+        return np.vstack(out).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def export_onnx(model_name: str, model_dir: str, quantize: bool):
+    """Exports a sentence-transformers model to `model_dir` for OnnxEmbeddings.
+
+    Needs torch and sentence-transformers once; the exported directory is
+    reused by every worker afterwards. The int8 variant is dynamic
+    quantization of the float32 graph (weights int8, activations quantized
+    at run time), so no calibration data is needed.
+    """
+    os.makedirs(os.path.dirname(model_dir) or ".", exist_ok=True)
+    with FileLock(f"{model_dir}.lock"):
+        if os.path.exists(os.path.join(model_dir, ONNX_META)):
+            if quantize and not os.path.exists(os.path.join(model_dir, "model.int8.onnx")):
+                _quantize(model_dir)
+            return
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Exporting embedding model {model_name} to ONNX ({model_dir})...")
+        model = SentenceTransformer(model_name, device="cpu")
+        transformer, modules = model[0], [type(m).__name__ for m in model]
+        pooling = model[1].get_pooling_mode_str() if len(model) > 1 and hasattr(model[1], "get_pooling_mode_str") else "mean"
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling}")
+
+        tokenizer = transformer.tokenizer
+        sample = tokenizer(["ONNX export sample", "a second, longer sample sentence"], padding=True, return_tensors="pt")
+        names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Encoder(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(names, inputs))).last_hidden_state
+
+        staging = f"{model_dir}.{uuid.uuid4().hex}.staging"
+        os.makedirs(staging)
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    _Encoder(transformer.auto_model.eval()),
+                    tuple(sample[name] for name in names),
+                    os.path.join(staging, "model.onnx"),
+                    input_names=names,
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+                    opset_version=17,
+                    dynamo=False,
+                )
+            tokenizer.save_pretrained(staging)
+            with open(os.path.join(staging, ONNX_META), "w", encoding="utf-8") as f:
+                json.dump({
+                    "model": model_name,
+                    "pooling": pooling,
+                    "normalize": "Normalize" in modules,
+                    "max_length": model.max_seq_length,
+                    "pad_id": tokenizer.pad_token_id or 0,
+                }, f)
+            if quantize:
+                _quantize(staging)
+            shutil.rmtree(model_dir, ignore_errors=True)
+            os.rename(staging, model_dir)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+
+def _quantize(model_dir: str):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = os.path.join(model_dir, "model.int8.onnx")
+    quantize_dynamic(os.path.join(model_dir, "model.onnx"), f"{target}.tmp", weight_type=QuantType.QInt8)
+    os.replace(f"{target}.tmp", target)
+
+
+def onnx_model_dir(model_name: str) -> str:
+    root = settings.EMBEDDING_ONNX_DIR or os.path.join(os.path.dirname(settings.INDEX_PATH) or ".", "onnx")
+    return os.path.join(root, model_name.replace("/", "__"))
+
+
+def create_embeddings() -> Embeddings:
+    """The embedding engine selected by EMBEDDING_BACKEND.
+
+    "torch" is sentence-transformers on PyTorch (which already sorts each
+    call's texts by length before batching); "onnx" exports the same model
+    on first use and serves it with ONNX Runtime, falling back to PyTorch if
+    the export or the runtime is unavailable.
+    """
+    backend = settings.EMBEDDING_BACKEND.lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {settings.EMBEDDING_BACKEND}")
+
+    if backend == "onnx":
+        model_dir = onnx_model_dir(settings.EMBEDDING_MODEL)
+        try:
+            export_onnx(settings.EMBEDDING_MODEL, model_dir, settings.EMBEDDING_QUANTIZE)
+            embeddings = OnnxEmbeddings(
+                model_dir, settings.EMBEDDING_BATCH_SIZE, settings.EMBEDDING_THREADS, settings.EMBEDDING_QUANTIZE
+            )
+            logger.info(
+                f"Embedding with ONNX Runtime ({'int8' if settings.EMBEDDING_QUANTIZE else 'float32'}, "
+                f"batch {embeddings.batch_size}, threads {settings.EMBEDDING_THREADS or 'auto'})."
+            )
+            return embeddings
+        except Exception as e:
+            logger.warning(f"ONNX embedding backend unavailable, using PyTorch: {e}")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if settings.EMBEDDING_THREADS:
+        import torch
+        torch.set_num_threads(settings.EMBEDDING_THREADS)
+    return HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL,
+        encode_kwargs={"batch_size": settings.EMBEDDING_BATCH_SIZE},
+    )
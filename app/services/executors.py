@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+
+
+class StageExecutor:
+    """Bounded thread pool that runs one CPU-bound stage of the chat pipeline off the event loop."""
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(0, max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{name}-stage")
+        # Created on first use, inside the running event loop
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.waiting = 0
+        self.completed = 0
+        self.peak_queued = 0
+        self._queue_time = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.max_pending)
+        with self._lock:
+            self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        try:
+            with self._lock:
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+            submitted = time.perf_counter()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, partial(self._call, submitted, fn, *args, **kwargs)
+            )
+        finally:
+            self._slots.release()
+
+    def _call(self, submitted: float, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self._queue_time += time.perf_counter() - submitted
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": self.queued,
+                "waiting_for_slot": self.waiting,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "avg_queue_ms": round(self._queue_time / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+
+# Embedding + hybrid search, and cross-encoder reranking, get separate pools so a
+# burst of reranks cannot hold up the (cheaper) retrieval of other sessions
+search_executor = StageExecutor("search", settings.SEARCH_STAGE_THREADS, settings.STAGE_MAX_PENDING)
+rerank_executor = StageExecutor("rerank", settings.RERANK_STAGE_THREADS, settings.STAGE_MAX_PENDING)
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {stage.name: stage.stats() for stage in (search_executor, rerank_executor)}
@@ -1,148 +1,687 @@
 import os
-import pickle
-from typing import List, Optional
-from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-from langchain_huggingface import HuggingFaceEmbeddings
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from filelock import FileLock
 from langchain_core.documents import Document
 from loguru import logger
 from app.core.config import settings
+from app.services.dedup import deduplicator
+from app.services.embedding_cache import cache_query_embeddings, embed_documents_cached, embedding_cache
+from app.services.embedding_engine import backend_name, create_embeddings, model_key
+from app.services.keyword_index import KeywordIndex
+from app.services.fusion import HybridSearcher
+from app.services.search_filter import SearchFilter
+from app.services import vector_index
+from app.services.segments import (
+    MANIFEST_FILE, MANIFEST_VERSION, SEGMENTS_DIR, GroupCommit, Segment, build_store, read_manifest,
+    remove_orphans, segment_name, write_manifest,
+)
+
+class IndexSnapshot:
+    """One immutable generation of the index; readers pin it, writers replace it in one assignment."""
+
+    def __init__(
+        self,
+        generation: int,
+        next_segment: int,
+        segments: Tuple[Segment, ...],
+        tombstones: FrozenSet[str],
+        keyword_index: Optional[KeywordIndex],
+        file_index: Dict[str, Tuple[str, ...]],
+        embeddings,
+        executor=None,
+        segment_tombstones: Optional[Dict[str, FrozenSet[str]]] = None,
+    ):
+        self.generation = generation
+        self.next_segment = next_segment
+        self.segments = segments
+        # Docstore ids of deleted chunks that still sit in some segment
+        self.tombstones = tombstones
+        self.keyword_index = keyword_index
+        # file_name -> docstore ids of its chunks
+        self.file_index = file_index
+        # segment name -> the tombstones that fall in it
+        self.segment_tombstones = segment_tombstones or {}
+        self.embeddings = embeddings
+        self.executor = executor
+        self._searchers: Dict[Tuple[float, float], Optional[HybridSearcher]] = {}
+
+    @classmethod
+    def empty(cls, embeddings, executor=None) -> "IndexSnapshot":
+        return cls(0, 1, (), frozenset(), None, {}, embeddings, executor)
+
+    @property
+    def num_chunks(self) -> int:
+        return sum(len(segment) for segment in self.segments) - len(self.tombstones)
+
+    def iter_documents(self) -> Iterator[Tuple[str, Document]]:
+        """(docstore id, chunk) for every live chunk, segment by segment."""
+        for segment in self.segments:
+            for doc_id, doc in segment.store.docstore._dict.items():
+                if doc_id not in self.tombstones:
+                    yield doc_id, doc
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        if doc_id in self.tombstones:
+            return None
+        for segment in self.segments:
+            doc = segment.get(doc_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def get_chunk(self, chunk_id: str) -> Optional[Document]:
+        """The live chunk whose metadata chunk_id is `chunk_id`, whatever its docstore id."""
+        doc = self.get_document(chunk_id)
+        if doc is not None and doc.metadata.get("chunk_id") == chunk_id:
+            return doc
+        for segment in self.segments:
+            doc_id = segment.chunk_alias(chunk_id)
+            if doc_id is not None and doc_id not in self.tombstones:
+                return segment.get(doc_id)
+        return None
+
+    def searcher(self, semantic_weight: float = 0.8, keyword_weight: float = 0.2) -> Optional[HybridSearcher]:
+        """The HybridSearcher over this snapshot, built once per weight pair."""
+        weights = (semantic_weight, keyword_weight)
+        if weights not in self._searchers:
+            self._searchers[weights] = self._build_searcher(*weights)
+        return self._searchers[weights]
+
+    def _build_searcher(self, semantic_weight: float, keyword_weight: float) -> Optional[HybridSearcher]:
+        if not self.segments:
+            return None
+        if not self.keyword_index:
+            logger.warning("Keyword index not initialized; hybrid search will use FAISS only.")
+
+        return HybridSearcher(
+            self.segments,
+            self.embeddings,
+            keyword_index=self.keyword_index,
+            tombstones=self.tombstones,
+            segment_tombstones=[self.segment_tombstones.get(segment.name, frozenset()) for segment in self.segments],
+            semantic_weight=semantic_weight,
+            keyword_weight=keyword_weight,
+            method=settings.HYBRID_FUSION,
+            depth_factor=settings.RETRIEVAL_DEPTH_FACTOR,
+            min_depth=settings.RETRIEVAL_MIN_DEPTH,
+            max_depth=settings.RETRIEVAL_MAX_DEPTH,
+            executor=self.executor,
+            exact_filter_max=settings.FILTER_EXACT_MAX_CHUNKS,
+        )
+
 
 class FAISSService:
+    """Segmented hybrid index: immutable segments published through manifest.json, compacted in the background."""
+
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        embeddings = create_embeddings()
+        self.embedding_model_key = model_key(embeddings)
+        self.embedding_backend = backend_name(embeddings)
+        # Queries (and templated per-entity sub-queries) repeat; chunks go through embedding_cache
+        self.embeddings = cache_query_embeddings(embeddings, self.embedding_model_key)
         self.index_path = settings.INDEX_PATH
-        self.vector_db: Optional[FAISS] = None
-        self.bm25_retriever: Optional[BM25Retriever] = None
+
+        os.makedirs(self.index_path, exist_ok=True)
+        # Single writer: serialized within the process and, through the lock file, across workers
+        self._write_lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(self.index_path, ".write.lock"))
+        self._group_commit = GroupCommit(self._commit_adds)
+        self._compaction_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        # Per-query fan-out over segments; FAISS releases the GIL while searching
+        self._fanout_threads = settings.SEARCH_FANOUT_THREADS or os.cpu_count() or 1
+        self._search_pool = ThreadPoolExecutor(max_workers=self._fanout_threads, thread_name_prefix="segment-search")
+        self.snapshot = IndexSnapshot.empty(self.embeddings, self._search_pool)
+
+        # Cross-worker hot reload: (mtime, size, inode) of manifest.json when last read
+        self._manifest_stamp: Optional[Tuple[int, int, int]] = None
+        self._next_manifest_check = 0.0
+        self._reloader: Optional[threading.Thread] = None
+        self._reload_lock = threading.Lock()
+
         self._load_all_indices()
 
+    @property
+    def _segments_root(self) -> str:
+        return os.path.join(self.index_path, SEGMENTS_DIR)
+
     def _load_all_indices(self):
-        """Loads FAISS and BM25 indices from disk."""
-        # Load FAISS
-        if os.path.exists(os.path.join(self.index_path, "index.faiss")):
+        """Loads the segments named by the manifest, converting a legacy
+        single-store index (index.faiss at the top of INDEX_PATH) first."""
+        for attempt in range(3):
             try:
-                self.vector_db = FAISS.load_local(
-                    self.index_path, 
-                    self.embeddings, 
-                    allow_dangerous_deserialization=True
-                )
-                logger.info("Loaded existing FAISS index.")
+                self._manifest_stamp = self._stat_manifest()
+                manifest = read_manifest(self.index_path)
+                if manifest is None and os.path.exists(os.path.join(self.index_path, "index.faiss")):
+                    with self._writing():
+                        manifest = read_manifest(self.index_path)
+                        if manifest is None:
+                            manifest, segment = self._migrate_legacy_layout()
+                            self._apply_manifest(manifest, [segment])
+                if manifest is not None and manifest["generation"] != self.snapshot.generation:
+                    self._apply_manifest(manifest)
+                    snapshot = self.snapshot
+                    logger.info(
+                        f"Loaded index generation {snapshot.generation}: {len(snapshot.segments)} segments, "
+                        f"{snapshot.num_chunks} chunks, {len(snapshot.tombstones)} tombstones."
+                    )
+                if manifest is not None:
+                    # Segments published by a writer that died before its manifest commit
+                    with self._writing():
+                        remove_orphans(self.index_path, [segment.name for segment in self.snapshot.segments])
+                self._backfill_signatures()
+                break
             except Exception as e:
-                logger.error(f"Error loading FAISS index: {e}")
+                # A compaction in another worker may have removed a segment we were about to load
+                logger.error(f"Error loading FAISS index (attempt {attempt + 1}): {e}")
+        self._maybe_compact()
 
-        # Load BM25 (serialized via pickle)
-        bm25_path = os.path.join(self.index_path, "bm25_retriever.pkl")
-        if os.path.exists(bm25_path):
-            try:
-                with open(bm25_path, "rb") as f:
-                    self.bm25_retriever = pickle.load(f)
-                logger.info("Loaded existing BM25 index.")
-            except Exception as e:
-                logger.error(f"Error loading BM25 index: {e}")
+    def _backfill_signatures(self):
+        """Registers existing chunks with the deduplicator the first time it runs on an index."""
+        snapshot = self.snapshot
+        if deduplicator is None or not snapshot.num_chunks or len(deduplicator):
+            return
+        ids, chunks = zip(*snapshot.iter_documents())
+        deduplicator.register(ids, chunks)
+        logger.info(f"Registered {len(ids)} existing chunks for deduplication.")
+
+    def _migrate_legacy_layout(self) -> Tuple[Dict[str, Any], Segment]:
+        """Copies the pre-segment FAISS store into segment 1 and writes the first manifest."""
+        store, _ = vector_index.load_store(self.index_path, self.embeddings, mmap=False)
+        logger.info(f"Converting legacy FAISS index ({store.index.ntotal} chunks) into a segment...")
+        segment = Segment.publish(Segment.stage(self._segments_root, store), segment_name(1), self.embeddings, settings.FAISS_MMAP)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "generation": 1,
+            "next_segment": 2,
+            "segments": [segment.name],
+            "tombstones": [],
+        }
+        write_manifest(self.index_path, manifest)
+        for legacy in ("index.faiss", "index.pkl", "file_index.json", "bm25_retriever.pkl", "keyword_index.pkl"):
+            legacy_path = os.path.join(self.index_path, legacy)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        shutil.rmtree(os.path.join(self.index_path, "keyword_index"), ignore_errors=True)
+        return manifest, segment
+
+    def _apply_manifest(self, manifest: Dict[str, Any], new_segments: Sequence[Segment] = ()):
+        """Builds the snapshot for `manifest` from the current one and publishes it.
+
+        Segments are immutable, so ones that are already loaded (or were
+        just written, `new_segments`) are reused and only unknown segments
+        are read from disk. Tombstone state, keyword statistics and the file
+        index are carried over and only patched for the segments and
+        tombstones that changed, so a commit costs O(change), not O(index).
+        Nothing reachable from the previous snapshot is modified.
+        """
+        previous = self.snapshot
+        loaded = {segment.name: segment for segment in previous.segments}
+        loaded.update((segment.name, segment) for segment in new_segments)
+        segments = tuple(
+            loaded.get(name) or Segment.load(os.path.join(self._segments_root, name), self.embeddings, settings.FAISS_MMAP)
+            for name in manifest["segments"]
+        )
+        tombstones = frozenset(manifest["tombstones"])
+
+        carried = [segment for segment in segments if segment in previous.segments]
+        fresh = [segment for segment in segments if segment not in previous.segments]
+        names = {segment.name for segment in segments}
+        gone = [segment for segment in previous.segments if segment.name not in names]
+
+        # Tombstones per segment: carried segments only gain the new ones
+        added: Dict[str, List[str]] = {}
+        for doc_id in tombstones - previous.tombstones:
+            for segment in carried:
+                if doc_id in segment:
+                    added.setdefault(segment.name, []).append(doc_id)
+                    break
+        for segment in fresh:
+            if len(tombstones) < len(segment):
+                dead = [doc_id for doc_id in tombstones if doc_id in segment]
+            else:
+                dead = [doc_id for doc_id in segment.ids() if doc_id in tombstones]
+            if dead:
+                added[segment.name] = dead
+        segment_tombstones = {
+            segment.name: previous.segment_tombstones.get(segment.name, frozenset()).union(added.get(segment.name, ()))
+            for segment in segments
+        }
+        segment_tombstones = {name: dead for name, dead in segment_tombstones.items() if dead}
+
+        keyword_index = KeywordIndex(
+            bases=[segment.keyword for segment in segments if segment.keyword is not None],
+            previous=previous.keyword_index,
+        )
+        keyword_index.remove([doc_id for dead in added.values() for doc_id in dead])
+
+        # Only files with chunks in new, removed or newly tombstoned segment rows are rebuilt
+        changed = {file_name for segment in fresh + gone for file_name in segment.files}
+        for segment in carried:
+            for doc_id in added.get(segment.name, ()):
+                changed.add(segment.get(doc_id).metadata.get("file_name"))
+        file_index = {file_name: ids for file_name, ids in previous.file_index.items() if file_name not in changed}
+        for file_name in changed:
+            live = tuple(
+                doc_id for segment in segments for doc_id in segment.files.get(file_name, ())
+                if doc_id not in segment_tombstones.get(segment.name, ())
+            )
+            if live:
+                file_index[file_name] = live
+
+        snapshot = IndexSnapshot(
+            manifest["generation"],
+            manifest["next_segment"],
+            segments,
+            tombstones,
+            keyword_index,
+            file_index,
+            self.embeddings,
+            self._search_pool,
+            segment_tombstones,
+        )
+        # Build the default searcher before publishing so no query pays for it
+        snapshot.searcher()
+        self.snapshot = snapshot
+
+    # Convenience accessors; pin `snapshot` when reading more than one of them
+    @property
+    def generation(self) -> int:
+        return self.snapshot.generation
+
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        return self.snapshot.segments
+
+    @property
+    def tombstones(self) -> FrozenSet[str]:
+        return self.snapshot.tombstones
+
+    @property
+    def keyword_index(self) -> Optional[KeywordIndex]:
+        return self.snapshot.keyword_index
+
+    @property
+    def file_index(self) -> Dict[str, Tuple[str, ...]]:
+        return self.snapshot.file_index
+
+    def _manifest(
+        self,
+        segments: Optional[Sequence[str]] = None,
+        tombstones: Optional[FrozenSet[str]] = None,
+        next_segment: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """The next manifest: the current snapshot with the given fields replaced."""
+        current = self.snapshot
+        return {
+            "version": MANIFEST_VERSION,
+            "generation": current.generation + 1,
+            "next_segment": current.next_segment if next_segment is None else next_segment,
+            "segments": [segment.name for segment in current.segments] if segments is None else list(segments),
+            "tombstones": sorted(current.tombstones if tombstones is None else tombstones),
+        }
+
+    def _commit(self, manifest: Dict[str, Any], new_segments: Sequence[Segment] = ()):
+        """Writes the next manifest and publishes its snapshot. Call with the write lock held."""
+        write_manifest(self.index_path, manifest)
+        self._manifest_stamp = self._stat_manifest()
+        self._apply_manifest(manifest, new_segments)
+
+    def _stat_manifest(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.index_path, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def check_for_updates(self):
+        """Picks up commits made by other workers.
+
+        Costs one clock read per call and one stat of manifest.json at most
+        every INDEX_RELOAD_INTERVAL seconds. When the manifest has changed,
+        the new generation is loaded on a background thread and swapped in
+        when complete; queries keep using the current generation meanwhile.
+        """
+        now = time.monotonic()
+        if now < self._next_manifest_check:
+            return
+        self._next_manifest_check = now + settings.INDEX_RELOAD_INTERVAL
+        stamp = self._stat_manifest()
+        if stamp is None or stamp == self._manifest_stamp:
+            return
+        with self._reload_lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(target=self._reload, name="index-reloader", daemon=True)
+            self._reloader.start()
+
+    def latest_generation(self) -> Optional[int]:
+        """The generation of the manifest on disk, loaded first if it is not
+        the current one; None when it could not be loaded.
+
+        Unlike check_for_updates this stats manifest.json on every call and
+        reloads synchronously, so results cached per generation are never
+        served after another worker's commit.
+        """
+        stamp = self._stat_manifest()
+        if stamp is not None and stamp != self._manifest_stamp:
+            self._reload()
+            if self._manifest_stamp != stamp:
+                return None
+        return self.generation
+
+    def _reload(self):
+        try:
+            with self._write_lock:
+                stamp = self._stat_manifest()
+                manifest = read_manifest(self.index_path)
+                previous = self.snapshot.generation
+                if manifest is not None and manifest["generation"] != previous:
+                    self._apply_manifest(manifest)
+                    logger.info(f"Reloaded index generation {previous} -> {self.generation} written by another worker.")
+                self._manifest_stamp = stamp
+        except Exception as e:
+            # e.g. a segment compacted away mid-load; the next check retries
+            logger.warning(f"Index reload failed: {e}")
+
+    @contextmanager
+    def _writing(self):
+        """Holds the index write lock. Commits made by other workers are
+        picked up first, so every write starts from the latest manifest."""
+        with self._write_lock, self._file_lock:
+            manifest = read_manifest(self.index_path)
+            if manifest is not None and manifest["generation"] != self.snapshot.generation:
+                self._apply_manifest(manifest)
+                self._manifest_stamp = self._stat_manifest()
+            yield
+
+    @property
+    def num_chunks(self) -> int:
+        return self.snapshot.num_chunks
+
+    def iter_documents(self) -> Iterator[Tuple[str, Document]]:
+        """(docstore id, chunk) for every live chunk of the current snapshot."""
+        return self.snapshot.iter_documents()
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        return self.snapshot.get_document(doc_id)
+
+    def get_chunk(self, chunk_id: str) -> Optional[Document]:
+        return self.snapshot.get_chunk(chunk_id)
+
+    def list_files(self) -> List[str]:
+        """Names of all files that currently have chunks in the index,
+        including files whose chunks were all deduplicated into others."""
+        self.check_for_updates()
+        files = list(self.snapshot.file_index)
+        if deduplicator is not None:
+            files.extend(sorted(deduplicator.files() - set(files)))
+        return files
+
+    def get_file_chunk_ids(self, file_name: str) -> List[str]:
+        ids = list(self.snapshot.file_index.get(file_name, ()))
+        if deduplicator is not None:
+            own = set(ids)
+            ids.extend(doc_id for doc_id in deduplicator.shared_chunks([file_name]) if doc_id not in own)
+        return ids
+
+    def _with_shared_chunks(self, search_filter: Optional[SearchFilter]) -> Optional[SearchFilter]:
+        """Widens a file_names filter to the chunks those files share with others."""
+        if deduplicator is None or search_filter is None or search_filter.file_names is None:
+            return search_filter
+        shared = deduplicator.shared_chunks(search_filter.file_names)
+        if not shared:
+            return search_filter
+        return SearchFilter(
+            file_names=search_filter.file_names,
+            document_types=search_filter.document_types,
+            indexed_after=search_filter.indexed_after,
+            indexed_before=search_filter.indexed_before,
+            shared_chunk_ids=shared,
+        )
 
     def add_documents(self, chunks: List[Document]):
-        """Adds chunks to both FAISS and BM25 indices."""
+        """Embeds the chunks and publishes them as a new segment.
+
+        Concurrent calls are group-committed: whichever call gets there first
+        embeds and writes everything queued up in one segment and one manifest
+        update, and every caller returns once its chunks are durable.
+        """
         if not chunks:
             return
+        self._group_commit.submit(chunks)
+        self._maybe_compact()
 
-        # Update FAISS
-        if self.vector_db is None:
-            self.vector_db = FAISS.from_documents(chunks, self.embeddings)
-        else:
-            self.vector_db.add_documents(chunks)
-        
-        # Update BM25 (re-build is necessary for rank-bm25 in current langchain impl)
-        # Note: In a production system with millions of docs, we'd use a more scalable keyword search.
-        # For this scale, re-initializing from all documents is fine.
-        all_docs = self.vector_db.docstore._dict.values()
-        self.bm25_retriever = BM25Retriever.from_documents(list(all_docs))
-        # Increase BM25 k to ensure we return enough candidates for downstream reranking
-        # Keep reasonably high to support multi-file queries
-        self.bm25_retriever.k = 50
-        
-        # Save both
-        os.makedirs(self.index_path, exist_ok=True)
-        self.vector_db.save_local(self.index_path)
-        
-        bm25_path = os.path.join(self.index_path, "bm25_retriever.pkl")
-        with open(bm25_path, "wb") as f:
-            pickle.dump(self.bm25_retriever, f)
-            
-        logger.info(f"Indexed {len(chunks)} new chunks. Total docs: {len(all_docs)}")
+    def _commit_adds(self, batches: List[List[Document]]):
+        chunks = [chunk for batch in batches for chunk in batch]
+        ids = self._assign_ids(chunks)
+
+        # Embedding and writing the segment files happen outside the write lock
+        vectors = embed_documents_cached(
+            self.embeddings, self.embedding_model_key, [chunk.page_content for chunk in chunks], embedding_cache
+        )
+        store = build_store(ids, chunks, vectors, self.embeddings, corpus=self.num_chunks + len(chunks))
+        staging_path = Segment.stage(self._segments_root, store)
+
+        with self._writing():
+            current = self.snapshot
+            name = segment_name(current.next_segment)
+            try:
+                segment = Segment.publish(staging_path, name, self.embeddings, settings.FAISS_MMAP)
+            except Exception:
+                shutil.rmtree(staging_path, ignore_errors=True)
+                raise
+            self._commit(
+                self._manifest(
+                    segments=[s.name for s in current.segments] + [name],
+                    next_segment=current.next_segment + 1,
+                ),
+                [segment],
+            )
+
+        if deduplicator is not None:
+            deduplicator.register(ids, chunks)
+        logger.info(f"Indexed {len(chunks)} new chunks into {name}. Total docs: {self.num_chunks}")
+
+    def _assign_ids(self, chunks: List[Document]) -> List[str]:
+        """Docstore ids for new chunks: their chunk_id, or a fresh uuid when
+        it is missing or belongs to a deleted chunk still in a segment."""
+        snapshot = self.snapshot
+        ids = []
+        for chunk in chunks:
+            doc_id = chunk.metadata.get("chunk_id")
+            if not doc_id or doc_id in snapshot.tombstones:
+                doc_id = str(uuid.uuid4())
+            elif snapshot.get_document(doc_id) is not None or doc_id in ids:
+                raise ValueError(f"Tried to add ids that already exist: {doc_id}")
+            ids.append(doc_id)
+        return ids
 
     def delete_documents_by_file(self, file_name: str):
-        """Removes all documents belonging to a specific file from FAISS and BM25."""
-        if self.vector_db is None:
+        """Removes all chunks of a file by tombstoning them in the manifest.
+
+        Chunks of other files that were deduplicated into this file's are
+        indexed again under their own file, so deleting one copy of a
+        document never takes the text away from the others.
+        """
+        revived, references = [], 0
+        with self._writing():
+            current = self.snapshot
+            ids_to_remove = current.file_index.get(file_name, ())
+            if ids_to_remove:
+                self._commit(self._manifest(tombstones=current.tombstones | set(ids_to_remove)))
+            if deduplicator is not None:
+                revived, references = deduplicator.forget_file(file_name, ids_to_remove)
+        if not ids_to_remove and not references:
+            logger.warning(f"No documents found for file: {file_name}")
             return
 
-        # 1. Identify IDs to remove
-        ids_to_remove = []
-        for doc_id, doc in self.vector_db.docstore._dict.items():
-            if doc.metadata.get("file_name") == file_name:
-                ids_to_remove.append(doc_id)
+        if revived:
+            # Several files may have shared the same chunk; only one copy comes back
+            kept, _ = deduplicator.filter(revived)
+            self.add_documents(kept)
+            logger.info(f"Re-indexed {len(kept)} chunks of other files that were deduplicated into {file_name}.")
+        logger.info(f"Deleted {len(ids_to_remove)} chunks for file: {file_name}. Remaining total docs: {self.num_chunks}")
+        self._maybe_compact()
 
-        if not ids_to_remove:
-            logger.warning(f"No documents found for file: {file_name}")
+    def _compaction_plan(self) -> List[Segment]:
+        """Segments to merge in the next compaction round.
+
+        A segment that is mostly tombstones or not in the vector layout the
+        corpus size calls for is rewritten on its own. Otherwise, while more than
+        SEGMENT_MAX_COUNT segments are below the shard size (_shard_size), the
+        smallest of them are merged, without growing the result past it.
+        Full segments are left alone; they are the shards of a large corpus.
+        """
+        snapshot = self.snapshot
+        segments = snapshot.segments
+        corpus = snapshot.num_chunks
+        live = {}
+        for segment in segments:
+            dead = len(snapshot.segment_tombstones.get(segment.name, ()))
+            if (len(segment) and dead / len(segment) > settings.SEGMENT_TOMBSTONE_RATIO) \
+                    or vector_index.needs_migration(segment.store.index, corpus):
+                return [segment]
+            live[segment.name] = len(segment) - dead
+
+        shard_size = self._shard_size(corpus)
+        open_segments = sorted(
+            (segment for segment in segments if live[segment.name] < shard_size),
+            key=lambda segment: live[segment.name],
+        )
+        excess = len(open_segments) - settings.SEGMENT_MAX_COUNT
+        picked, size = [], 0
+        for segment in open_segments[:max(excess + 1, 0)]:
+            if picked and size + live[segment.name] > shard_size:
+                break
+            picked.append(segment)
+            size += live[segment.name]
+        return picked if len(picked) > 1 else []
+
+    def _shard_size(self, corpus: int) -> int:
+        """Chunks at which compaction stops growing a segment: an even split of the
+        corpus over the fan-out threads, so every thread gets a shard to search,
+        within [SEGMENT_SHARD_MIN_CHUNKS, SEGMENT_MAX_CHUNKS]."""
+        even = -(-corpus // self._fanout_threads)
+        return min(settings.SEGMENT_MAX_CHUNKS, max(settings.SEGMENT_SHARD_MIN_CHUNKS, even))
+
+    def _maybe_compact(self):
+        """Starts the background compactor if the segment layout calls for it."""
+        if not self._compaction_plan():
             return
+        with self._compaction_lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._compact_in_background, name="index-compactor", daemon=True)
+            self._compactor.start()
 
-        # 2. Delete from FAISS
-        self.vector_db.delete(ids_to_remove)
-        logger.info(f"Deleted {len(ids_to_remove)} chunks for file: {file_name}")
+    def _compact_in_background(self):
+        try:
+            while self.compact():
+                pass
+        except Exception as e:
+            logger.error(f"Index compaction failed: {e}")
 
-        # 3. Re-build BM25 retriever
-        all_docs = list(self.vector_db.docstore._dict.values())
-        if all_docs:
-            self.bm25_retriever = BM25Retriever.from_documents(all_docs)
-            self.bm25_retriever.k = 50
-        else:
-            self.bm25_retriever = None
+    def compact(self) -> bool:
+        """Runs one round of the compaction plan; returns whether anything changed.
 
-        # 4. Save updated indices
-        os.makedirs(self.index_path, exist_ok=True)
-        self.vector_db.save_local(self.index_path)
-        
-        bm25_path = os.path.join(self.index_path, "bm25_retriever.pkl")
-        if self.bm25_retriever:
-            with open(bm25_path, "wb") as f:
-                pickle.dump(self.bm25_retriever, f)
-        elif os.path.exists(bm25_path):
-            os.remove(bm25_path)
-            
-        logger.info(f"Index updated after deleting {file_name}. Remaining total docs: {len(all_docs)}")
+        The merged segment is built from immutable inputs without holding the
+        write lock, so uploads, deletes and searches carry on meanwhile; only
+        the manifest swap takes the lock. Vectors are read back from the
+        indices where they are stored exactly (float32 and re-ranked
+        layouts); quantized segments take theirs from the embedding cache
+        (re-embedding misses) so quantization error does not compound with
+        every merge. Keyword postings are merged directly.
+        """
+        picked = self._compaction_plan()
+        if not picked:
+            return False
+        snapshot = self.snapshot
+        tombstones = snapshot.tombstones
 
-    def get_hybrid_retriever(self, semantic_weight: float = 0.8, keyword_weight: float = 0.2):
-        """Returns an EnsembleRetriever combining FAISS and BM25."""
-        if not self.vector_db or not self.bm25_retriever:
-            logger.warning("Indices not fully initialized for hybrid search.")
-            if self.vector_db:
-                return self.vector_db.as_retriever(search_kwargs={"k": 15})
-            return None
+        ids, documents, vectors = [], [], []
+        for segment in picked:
+            index, _ = vector_index.read_index(segment.path, mmap=False)
+            mapping = segment.store.index_to_docstore_id
+            keep = [pos for pos in range(index.ntotal) if mapping[pos] not in tombstones]
+            kept = [segment.get(mapping[pos]) for pos in keep]
+            if vector_index.stores_exact_vectors(index):
+                vectors.append(vector_index.extract_vectors(index)[keep])
+            elif kept:
+                vectors.append(embed_documents_cached(
+                    self.embeddings, self.embedding_model_key, [doc.page_content for doc in kept], embedding_cache
+                ))
+            ids.extend(mapping[pos] for pos in keep)
+            documents.extend(kept)
+        dropped = {doc_id for segment in picked for doc_id in snapshot.segment_tombstones.get(segment.name, ())}
+
+        staging_path = None
+        if ids:
+            keyword_index = KeywordIndex(bases=[segment.keyword for segment in picked if segment.keyword is not None])
+            keyword_index.remove(dropped)
+            store = build_store(ids, documents, np.concatenate(vectors), self.embeddings, corpus=snapshot.num_chunks)
+            staging_path = Segment.stage(self._segments_root, store, keyword_index.compact())
 
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[
-                # Increase FAISS retriever k to ensure upstream callers requesting
-                # larger top_k (e.g. 25) receive enough candidates from the vector store.
-                self.vector_db.as_retriever(search_kwargs={"k": 50}),
-                self.bm25_retriever
-            ],
-            weights=[semantic_weight, keyword_weight]
+        with self._writing():
+            current = self.snapshot
+            names = [segment.name for segment in current.segments]
+            if any(segment.name not in names for segment in picked):
+                # Another worker compacted these segments first
+                if staging_path:
+                    shutil.rmtree(staging_path, ignore_errors=True)
+                return False
+            merged = {segment.name for segment in picked}
+            names = [name for name in names if name not in merged]
+            next_segment = current.next_segment
+            new_segments = []
+            if staging_path:
+                new_segments.append(Segment.publish(staging_path, segment_name(next_segment), self.embeddings, settings.FAISS_MMAP))
+                names.insert(0, new_segments[0].name)
+                next_segment += 1
+            self._commit(
+                self._manifest(segments=names, tombstones=current.tombstones - dropped, next_segment=next_segment),
+                new_segments,
+            )
+            remove_orphans(self.index_path, names)
+
+        logger.info(
+            f"Compacted {len(picked)} segments into {len(ids)} chunks "
+            f"(dropped {len(dropped)} deleted chunks); {len(self.segments)} segments remain."
         )
-        return ensemble_retriever
+        return True
+
+    def get_hybrid_retriever(self, semantic_weight: float = 0.8, keyword_weight: float = 0.2):
+        """Returns the HybridSearcher fusing FAISS and BM25 for the current index snapshot."""
+        self.check_for_updates()
+        return self.snapshot.searcher(semantic_weight, keyword_weight)
 
-    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
-        """Hybrid search with ensemble retrieval."""
+    def similarity_search(
+        self, query: str, k: int = 5, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Document]:
+        """Hybrid search with reciprocal-rank fusion.
+
+        `fetch_k` and `bm25_k` set the FAISS and BM25 candidate depths; by
+        default they scale with `k` (see HybridSearcher.budget), and are
+        widened automatically only when the first pass comes back short.
+        `search_filter` (file names, document type, indexed_at range) is
+        applied inside both engines, so the top k are the best matching
+        chunks rather than whatever survives a global top k.
+        """
         retriever = self.get_hybrid_retriever()
         if not retriever:
             return []
-        import time
-        from app.core.config import settings
 
-        # Request candidates from the ensemble retriever and then slice to the
-        # requested `k`. If the retriever returns too few candidates, retry
-        # once with a larger k to improve recall (safeguard).
+        search_filter = self._with_shared_chunks(search_filter)
         start = time.time()
-        results = retriever.get_relevant_documents(query)
+        results = retriever.search(query, k, fetch_k=fetch_k, bm25_k=bm25_k, search_filter=search_filter)
         retrieval_latency = (time.time() - start)
 
         # record metrics
@@ -154,34 +693,53 @@ class FAISSService:
             sources = []
 
         if settings.DEBUG_RAG:
-            logger.debug(f"FAISS hybrid retriever returned {len(results)} candidates for requested k={k} (latency={retrieval_latency:.3f}s)")
+            depths = retriever.budget(k, fetch_k, bm25_k)
+            logger.debug(f"FAISS hybrid retriever returned {len(results)} candidates for requested k={k}, depths={depths}, filter={search_filter} (latency={retrieval_latency:.3f}s)")
             try:
                 logger.debug(f"FAISS hybrid retriever candidate sources: {sources}")
             except Exception:
                 pass
 
-        # Safeguard: if fewer than 3 candidates, retry once with increased k
-        if len(results) < 3 and k < 100:
-            # Expand candidate window and retry once
-            retry_k = min(100, max(k * 3, 25))
-            if settings.DEBUG_RAG:
-                logger.info(f"Insufficient candidates ({len(results)}) for k={k}, retrying retriever with k={retry_k}")
-            start2 = time.time()
-            results_retry = retriever.get_relevant_documents(query)
-            retry_latency = (time.time() - start2)
-            # update metrics with retry result if better
-            try:
-                from app.services.metrics import record_retrieval
-                sources_retry = [d.metadata.get("file_name") or d.metadata.get("source") for d in results_retry]
-                record_retrieval(retry_latency, len(results_retry), sources_retry)
-            except Exception:
-                pass
-            if settings.DEBUG_RAG:
-                logger.debug(f"Retry returned {len(results_retry)} candidates (latency={retry_latency:.3f}s)")
-            # Choose the larger result set
-            if len(results_retry) > len(results):
-                results = results_retry
+        return results
+
+    def similarity_search_many(
+        self, queries: Sequence[str], k: int = 5, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filters: Optional[Sequence[Optional[SearchFilter]]] = None, with_scores: bool = False,
+    ) -> List[List[Any]]:
+        """similarity_search for several queries against the same snapshot.
+
+        The queries are embedded in one model call and the unfiltered ones
+        share one FAISS search per segment; `search_filters` gives each
+        query its own filter (or None). With `with_scores`, each hit is a
+        (Document, fused score) pair.
+        """
+        retriever = self.get_hybrid_retriever()
+        if not retriever:
+            return [[] for _ in queries]
+
+        if search_filters is not None:
+            search_filters = [self._with_shared_chunks(f) for f in search_filters]
+        start = time.time()
+        results = retriever.search_many_with_scores(queries, k, fetch_k=fetch_k, bm25_k=bm25_k, search_filters=search_filters)
+        retrieval_latency = time.time() - start
+        if not with_scores:
+            results = [[doc for doc, _ in hits] for hits in results]
+
+        try:
+            from app.services.metrics import record_retrieval
+            sources = [
+                d.metadata.get("file_name") or d.metadata.get("source")
+                for hits in results for d in (hit[0] if with_scores else hit for hit in hits)
+            ]
+            record_retrieval(retrieval_latency, len(sources), sources)
+        except Exception:
+            pass
 
-        return results[:k]
+        if settings.DEBUG_RAG:
+            logger.debug(
+                f"FAISS hybrid retriever answered {len(queries)} queries in one batch "
+                f"({[len(hits) for hits in results]} candidates, latency={retrieval_latency:.3f}s)"
+            )
+        return results
 
 faiss_service = FAISSService()
@@ -0,0 +1,412 @@
+from concurrent.futures import Executor
+from typing import AbstractSet, List, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from loguru import logger
+from app.services.search_filter import SearchFilter
+from app.services.vector_index import filtered_search_params, index_kind, supports_selector
+
+# Vectors reconstructed at a time when scoring a subset directly
+SCORE_BLOCK = 65536
+
+# Same smoothing constant as langchain's EnsembleRetriever
+RRF_K = 60
+
+
+def _encode_ids(id_lists: Sequence[np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Maps every candidate id to a dense integer code shared by all lists."""
+    uniq, inverse = np.unique(np.concatenate(id_lists), return_inverse=True)
+    bounds = np.cumsum([0] + [len(ids) for ids in id_lists])
+    return uniq, [inverse[bounds[i]:bounds[i + 1]] for i in range(len(id_lists))]
+
+
+def embed_queries(embeddings: Embeddings, queries: List[str]) -> np.ndarray:
+    """Query vectors as one float32 matrix, computed in a single model call where
+    the embedder allows it."""
+    if len(queries) == 1:
+        vectors = [embeddings.embed_query(queries[0])]
+    elif hasattr(embeddings, "embed_queries"):
+        vectors = embeddings.embed_queries(queries)
+    else:
+        # Symmetric sentence-transformers models embed queries and documents alike
+        vectors = embeddings.embed_documents(queries)
+    return np.asarray(vectors, dtype=np.float32).reshape(len(queries), -1)
+
+
+def _score_positions(
+    index: faiss.Index, positions: np.ndarray, vector: np.ndarray, inner_product: bool, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k of `positions` by the similarity of their stored vectors to `vector`."""
+    best_positions, best_scores = np.empty(0, dtype=np.int64), np.empty(0)
+    for start in range(0, len(positions), SCORE_BLOCK):
+        block = positions[start:start + SCORE_BLOCK]
+        vectors = index.reconstruct_batch(block)
+        if inner_product:
+            scores = vectors @ vector[0]
+        else:
+            scores = -np.square(vectors - vector[0]).sum(axis=1)
+        best_positions, best_scores = _top_k(
+            np.concatenate([best_positions, block]), np.concatenate([best_scores, scores.astype(np.float64)]), k
+        )
+    return best_positions, best_scores
+
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return ids[top], scores[top]
+
+
+def weighted_rrf(
+    id_lists: Sequence[np.ndarray], weights: Sequence[float], k: int, c: int = RRF_K
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted reciprocal-rank fusion of ranked id arrays (best first).
+
+    Returns the top-k fused ids and their scores, best first.
+    """
+    if not id_lists or k <= 0:
+        return np.empty(0), np.empty(0)
+    uniq, codes = _encode_ids(id_lists)
+    scores = np.zeros(len(uniq))
+    for code, weight in zip(codes, weights):
+        np.add.at(scores, code, weight / (np.arange(1, len(code) + 1) + c))
+    return _top_k(uniq, scores, k)
+
+
+def normalized_score_fusion(
+    id_lists: Sequence[np.ndarray], score_lists: Sequence[np.ndarray], weights: Sequence[float], k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted sum of min-max normalized scores (higher is better in every list)."""
+    if not id_lists or k <= 0:
+        return np.empty(0), np.empty(0)
+    uniq, codes = _encode_ids(id_lists)
+    fused = np.zeros(len(uniq))
+    for code, scores, weight in zip(codes, score_lists, weights):
+        lo, hi = scores.min(), scores.max()
+        norm = (scores - lo) / (hi - lo) if hi > lo else np.ones(len(scores))
+        np.add.at(fused, code, weight * norm)
+    return _top_k(uniq, fused, k)
+
+
+class HybridSearcher:
+    """FAISS + BM25 search over one index generation, fused with RRF on chunk ids."""
+
+    def __init__(
+        self,
+        segments: Sequence,
+        embeddings: Embeddings,
+        keyword_index=None,
+        tombstones: AbstractSet[str] = frozenset(),
+        segment_tombstones: Optional[Sequence[AbstractSet[str]]] = None,
+        semantic_weight: float = 0.8,
+        keyword_weight: float = 0.2,
+        method: str = "rrf",
+        depth_factor: int = 2,
+        min_depth: int = 20,
+        max_depth: int = 200,
+        executor: Optional[Executor] = None,
+        exact_filter_max: int = 20000,
+    ):
+        self.segments = list(segments)
+        self.embeddings = embeddings
+        self.keyword_index = keyword_index
+        self.tombstones = tombstones
+        # The tombstones that fall in each segment, unless the caller already knows them
+        if segment_tombstones is None:
+            segment_tombstones = [{doc_id for doc_id in tombstones if doc_id in segment} for segment in self.segments]
+        self._segment_tombstones = list(segment_tombstones)
+        self._dead = [len(dead) for dead in self._segment_tombstones]
+        self.weights = (semantic_weight, keyword_weight)
+        self.method = method
+        self.depth_factor = depth_factor
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.executor = executor
+        self.exact_filter_max = exact_filter_max
+        self._dead_positions: Optional[List[np.ndarray]] = None
+        self._exclusions: Optional[List[Optional[tuple]]] = None
+
+    def budget(self, k: int, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None) -> Tuple[int, int]:
+        """Returns the (FAISS depth, BM25 depth) used to answer a top-k query."""
+        if fetch_k is None:
+            fetch_k = min(max(k * self.depth_factor, self.min_depth), self.max_depth)
+        if bm25_k is None:
+            bm25_k = fetch_k
+        return max(fetch_k, 1), max(bm25_k, 1)
+
+    def _search_segment(
+        self, segment, dead: int, exclusion, vector: np.ndarray, k: int, allowed: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if allowed is not None:
+            return self._search_allowed(segment, allowed, vector, k)
+        return self._search_segment_batch(segment, dead, exclusion, vectors=vector, k=k)[0]
+
+    def _search_segment_batch(
+        self, segment, dead: int, exclusion, vectors: np.ndarray, k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k of one segment for every row of `vectors`, in one FAISS call."""
+        store = segment.store
+        if exclusion is not None:
+            # The index skips tombstoned positions itself, so depth k yields k live chunks
+            depth = min(k, len(segment) - dead)
+        else:
+            # No selector support: search deeper by the number of tombstoned chunks, drop them below
+            depth = min(k + dead, len(segment))
+        if depth <= 0:
+            return [(np.empty(0), np.empty(0)) for _ in range(len(vectors))]
+        if exclusion is not None:
+            distances, positions = store.index.search(vectors, depth, params=exclusion[0])
+        else:
+            distances, positions = store.index.search(vectors, depth)
+        mapping = store.index_to_docstore_id
+        results = []
+        for row_distances, row_positions in zip(distances, positions):
+            found = row_positions >= 0
+            ids = np.array([mapping[int(p)] for p in row_positions[found]])
+            scores = row_distances[found].astype(np.float64)
+            if store.distance_strategy != DistanceStrategy.MAX_INNER_PRODUCT:
+                scores = -scores  # smaller L2 distance is better
+            if dead and exclusion is None:
+                live = np.array([doc_id not in self.tombstones for doc_id in ids], dtype=bool)
+                ids, scores = ids[live], scores[live]
+            results.append((ids, scores))
+        return results
+
+    def _search_allowed(self, segment, allowed: np.ndarray, vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k among the segment's `allowed` positions (live chunks passing the filter)."""
+        store = segment.store
+        depth = min(k, len(allowed))
+        if depth <= 0:
+            return np.empty(0), np.empty(0)
+        inner_product = store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+        small = len(allowed) <= self.exact_filter_max and index_kind(store.index) != "ivf"
+        if small or not supports_selector(store.index):
+            # Small subsets, and layouts without selector support: score the allowed vectors directly
+            positions, scores = _score_positions(store.index, allowed, vector, inner_product, depth)
+        else:
+            selector = faiss.IDSelectorBatch(allowed)
+            distances, positions = store.index.search(
+                vector, depth, params=filtered_search_params(store.index, selector)
+            )
+            found = positions[0] >= 0
+            positions, scores = positions[0][found], distances[0][found].astype(np.float64)
+            if not inner_product:
+                scores = -scores
+        mapping = store.index_to_docstore_id
+        return np.array([mapping[int(p)] for p in positions]), scores
+
+    def _tombstoned_positions(self) -> List[Optional[np.ndarray]]:
+        """Per segment, the positions of its tombstoned chunks (None if it has none)."""
+        if self._dead_positions is None:
+            self._dead_positions = [
+                segment.positions(dead) if dead else None
+                for segment, dead in zip(self.segments, self._segment_tombstones)
+            ]
+        return self._dead_positions
+
+    def _segment_exclusions(self) -> List[Optional[tuple]]:
+        """Per segment, search parameters that skip its tombstoned positions, with the
+        selectors they point to; None if nothing is dead or the index takes no selector."""
+        if self._exclusions is None:
+            exclusions = []
+            for segment, dead in zip(self.segments, self._tombstoned_positions()):
+                if dead is None or not len(dead) or not supports_selector(segment.store.index):
+                    exclusions.append(None)
+                    continue
+                batch = faiss.IDSelectorBatch(dead)
+                selector = faiss.IDSelectorNot(batch)
+                exclusions.append((filtered_search_params(segment.store.index, selector), selector, batch))
+            self._exclusions = exclusions
+        return self._exclusions
+
+    def _allowed_positions(self, search_filter: SearchFilter) -> List[np.ndarray]:
+        """Per segment, the positions of live chunks that pass `search_filter`."""
+        allowed = []
+        for segment, dead in zip(self.segments, self._tombstoned_positions()):
+            positions = search_filter.segment_positions(segment)
+            if dead is not None and len(positions):
+                positions = positions[~np.isin(positions, dead)]
+            allowed.append(positions)
+        return allowed
+
+    def _vector_candidates(
+        self, vector: np.ndarray, k: int, allowed: Optional[List[np.ndarray]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if allowed is None:
+            jobs = list(zip(self.segments, self._dead, self._segment_exclusions(), [None] * len(self.segments)))
+        else:
+            jobs = [(segment, 0, None, positions) for segment, positions in zip(self.segments, allowed) if len(positions)]
+        if self.executor is not None and len(jobs) > 1:
+            parts = list(self.executor.map(
+                lambda job: self._search_segment(job[0], job[1], job[2], vector, k, job[3]), jobs
+            ))
+        else:
+            parts = [
+                self._search_segment(segment, dead, exclusion, vector, k, positions)
+                for segment, dead, exclusion, positions in jobs
+            ]
+        parts = [part for part in parts if len(part[0])]
+        if not parts:
+            return np.empty(0), np.empty(0)
+        return _top_k(np.concatenate([ids for ids, _ in parts]), np.concatenate([scores for _, scores in parts]), k)
+
+    def _vector_candidates_batch(self, vectors: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Unfiltered top-k for every row of `vectors`: one matrix search per segment."""
+        jobs = list(zip(self.segments, self._dead, self._segment_exclusions()))
+        if self.executor is not None and len(jobs) > 1:
+            per_segment = list(self.executor.map(lambda job: self._search_segment_batch(*job, vectors, k), jobs))
+        else:
+            per_segment = [
+                self._search_segment_batch(segment, dead, exclusion, vectors, k) for segment, dead, exclusion in jobs
+            ]
+        results = []
+        for row in range(len(vectors)):
+            parts = [hits[row] for hits in per_segment if len(hits[row][0])]
+            if not parts:
+                results.append((np.empty(0), np.empty(0)))
+                continue
+            results.append(_top_k(
+                np.concatenate([ids for ids, _ in parts]), np.concatenate([scores for _, scores in parts]), k
+            ))
+        return results
+
+    def _keyword_candidates(
+        self, query: str, k: int, allowed_ids: Optional[List[str]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.keyword_index:
+            return np.empty(0), np.empty(0)
+        hits = self.keyword_index.search(query, k, allowed=allowed_ids)
+        return np.array([doc_id for doc_id, _ in hits]), np.array([score for _, score in hits])
+
+    def _fuse(
+        self, vector: np.ndarray, query: str, k: int, fetch_k: int, bm25_k: int,
+        allowed: Optional[List[np.ndarray]] = None, allowed_ids: Optional[List[str]] = None,
+        vector_hits: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ):
+        """One fusion pass. Also reports whether any engine filled its depth
+        (i.e. a deeper pass could surface more candidates). `vector_hits`
+        are FAISS candidates already fetched at depth `fetch_k`."""
+        if vector_hits is None:
+            vector_hits = self._vector_candidates(vector, fetch_k, allowed)
+        vector_ids, vector_scores = vector_hits
+        keyword_ids, keyword_scores = self._keyword_candidates(query, bm25_k, allowed_ids)
+        saturated = len(vector_ids) >= fetch_k or len(keyword_ids) >= bm25_k
+
+        lists = [
+            (vector_ids, vector_scores, self.weights[0]),
+            (keyword_ids, keyword_scores, self.weights[1]),
+        ]
+        lists = [entry for entry in lists if len(entry[0])]
+        if not lists:
+            return np.empty(0), np.empty(0), saturated
+
+        id_lists = [ids for ids, _, _ in lists]
+        weights = [weight for _, _, weight in lists]
+        if self.method == "score":
+            ids, scores = normalized_score_fusion(id_lists, [s for _, s, _ in lists], weights, k)
+        else:
+            ids, scores = weighted_rrf(id_lists, weights, k)
+        return ids, scores, saturated
+
+    def search_with_scores(
+        self, query: str, k: int, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Top-k (Document, fused score) pairs, best first.
+
+        If the first pass yields fewer than k chunks while an engine was
+        saturated, the depths are widened (up to max_depth) and the search is
+        repeated with the same query embedding. With a `search_filter`, only
+        matching chunks are candidates.
+        """
+        return self.search_many_with_scores([query], k, fetch_k, bm25_k, [search_filter])[0]
+
+    def search_many_with_scores(
+        self, queries: Sequence[str], k: int, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filters: Optional[Sequence[Optional[SearchFilter]]] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """search_with_scores for several queries at once.
+
+        All queries are embedded in one model call, and the unfiltered ones
+        are answered by one FAISS search per segment with the whole query
+        matrix. Filtered queries search their own subsets; keyword search
+        and fusion run per query.
+        """
+        if k <= 0 or not queries:
+            return [[] for _ in queries]
+        fetch_k, bm25_k = self.budget(k, fetch_k, bm25_k)
+        search_filters = list(search_filters or [None] * len(queries))
+        vectors = embed_queries(self.embeddings, list(queries))
+        if self.segments and getattr(self.segments[0].store, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+
+        plain = [i for i, search_filter in enumerate(search_filters) if not search_filter]
+        vector_hits = dict(zip(plain, self._vector_candidates_batch(vectors[plain], fetch_k))) if plain else {}
+
+        results = []
+        for i, (query, search_filter) in enumerate(zip(queries, search_filters)):
+            allowed = allowed_ids = None
+            if search_filter:
+                allowed = self._allowed_positions(search_filter)
+                if not any(len(positions) for positions in allowed):
+                    results.append([])
+                    continue
+                allowed_ids = [
+                    segment.store.index_to_docstore_id[int(p)]
+                    for segment, positions in zip(self.segments, allowed) for p in positions
+                ]
+            results.append(self._search_vector(
+                vectors[i:i + 1], query, k, fetch_k, bm25_k, allowed, allowed_ids, vector_hits.get(i)
+            ))
+        return results
+
+    def _search_vector(
+        self, vector: np.ndarray, query: str, k: int, fetch_k: int, bm25_k: int,
+        allowed: Optional[List[np.ndarray]], allowed_ids: Optional[List[str]],
+        vector_hits: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> List[Tuple[Document, float]]:
+        while True:
+            ids, scores, saturated = self._fuse(vector, query, k, fetch_k, bm25_k, allowed, allowed_ids, vector_hits)
+            if len(ids) >= k or not saturated or (fetch_k >= self.max_depth and bm25_k >= self.max_depth):
+                break
+            fetch_k = max(fetch_k, min(fetch_k * 4, self.max_depth))
+            bm25_k = max(bm25_k, min(bm25_k * 4, self.max_depth))
+            vector_hits = None
+            logger.debug(f"Hybrid search returned {len(ids)}/{k} chunks; expanding depth to {fetch_k}/{bm25_k}")
+
+        results = []
+        for doc_id, score in zip(ids.tolist(), scores.tolist()):
+            doc = self.get_document(doc_id)
+            if doc is not None:
+                results.append((doc, score))
+        return results
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        if doc_id in self.tombstones:
+            return None
+        for segment in self.segments:
+            doc = segment.get(doc_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def search(
+        self, query: str, k: int, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query, k, fetch_k, bm25_k, search_filter)]
+
+    def search_many(
+        self, queries: Sequence[str], k: int, fetch_k: Optional[int] = None, bm25_k: Optional[int] = None,
+        search_filters: Optional[Sequence[Optional[SearchFilter]]] = None,
+    ) -> List[List[Document]]:
+        return [
+            [doc for doc, _ in hits]
+            for hits in self.search_many_with_scores(queries, k, fetch_k, bm25_k, search_filters)
+        ]
@@ -0,0 +1,362 @@
+import json
+import math
+import os
+import re
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+_TOKEN_RE = re.compile(r"\w+")
+# Terms and doc ids are stored as fixed-width byte strings so they can be
+# binary-searched straight off a memory map. Tokens longer than this are
+# almost always noise (hashes, base64, URLs) and would only widen the vocab.
+MAX_TERM_LEN = 32
+FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens used for both indexing and querying."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) <= MAX_TERM_LEN]
+
+
+def _encode(values: Iterable[str]) -> np.ndarray:
+    encoded = [v.encode("utf-8") for v in values]
+    return np.array(encoded, dtype=bytes) if encoded else np.empty(0, dtype="S1")
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) for every (start, end) pair."""
+    lengths = ends - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+
+class KeywordSegment:
+    """Read-only columnar keyword index (CSR postings and forward index); every array may be a memory map."""
+
+    # One .npy file each: sorted terms; CSR postings term -> (row, tf); sorted doc ids and
+    # token counts per row; CSR forward index row -> (term, tf)
+    ARRAYS = ("vocab", "indptr", "post_rows", "post_tfs", "doc_ids", "doc_len",
+              "fwd_indptr", "fwd_terms", "fwd_tfs")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], total_len: int):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.total_len = total_len
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordSegment":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported keyword index format: {meta.get('version')}")
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in cls.ARRAYS
+        }
+        return cls(arrays, meta["total_len"])
+
+    def write(self, path: str):
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "num_docs": len(self), "total_len": self.total_len}, f)
+
+    @staticmethod
+    def _lookup(table: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """Row of each key in a sorted table, or -1 when absent."""
+        if not len(table) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(table, keys)
+        clipped = np.minimum(pos, len(table) - 1)
+        return np.where(table[clipped] == keys, clipped, -1)
+
+    def term_ids(self, terms: List[str]) -> np.ndarray:
+        return self._lookup(self.vocab, _encode(terms))
+
+    def rows(self, doc_ids: List[str]) -> np.ndarray:
+        return self._lookup(self.doc_ids, _encode(doc_ids))
+
+    def df(self, term_id: int) -> int:
+        return int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+
+class _Tombstones:
+    """Deleted rows of one KeywordSegment and what they take out of its statistics."""
+
+    def __init__(self, base: KeywordSegment):
+        self.dead = np.zeros(len(base), dtype=bool)
+        # Postings per term that belong to dead rows
+        self.df = np.zeros(len(base.vocab), dtype=np.int32)
+        self.count = 0
+        self.length = 0
+
+    def copy(self) -> "_Tombstones":
+        other = _Tombstones.__new__(_Tombstones)
+        other.dead, other.df = self.dead.copy(), self.df.copy()
+        other.count, other.length = self.count, self.length
+        return other
+
+
+class KeywordIndex:
+    """Incremental BM25+ keyword index over memory-mapped segments, with tombstones for removed chunks."""
+
+    def __init__(
+        self, k1: float = 1.5, b: float = 0.75, bases: Optional[List[KeywordSegment]] = None,
+        previous: Optional["KeywordIndex"] = None,
+    ):
+        self.k1 = k1
+        self.b = b
+        self._bases: List[KeywordSegment] = list(bases or [])
+        # Tombstoned rows per segment (None while it has none). Bases shared with
+        # `previous` start from its tombstones; those are copied before the first change.
+        carried = {id(base): state for base, state in zip(previous._bases, previous._tombstones)} if previous else {}
+        self._tombstones: List[Optional[_Tombstones]] = [carried.get(id(base)) for base in self._bases]
+        self._shared = [state is not None for state in self._tombstones]
+        # Delta: chunks added since the segments were written
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._num_docs = sum(len(base) - (state.count if state else 0) for base, state in zip(self._bases, self._tombstones))
+        self._total_len = sum(base.total_len - (state.length if state else 0) for base, state in zip(self._bases, self._tombstones))
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    def __contains__(self, doc_id: str) -> bool:
+        if doc_id in self._doc_len:
+            return True
+        for base, tombstones in zip(self._bases, self._tombstones):
+            row = int(base.rows([doc_id])[0])
+            if row >= 0 and (tombstones is None or not tombstones.dead[row]):
+                return True
+        return False
+
+    @property
+    def avg_doc_len(self) -> float:
+        return self._total_len / self._num_docs if self._num_docs else 0.0
+
+    @classmethod
+    def from_documents(cls, ids: Iterable[str], documents: Iterable[Document], **kwargs) -> "KeywordIndex":
+        index = cls(**kwargs)
+        index.add_documents(ids, documents)
+        return index
+
+    def add(self, doc_id: str, text: str):
+        """Index a single chunk. Re-adding an existing id replaces it."""
+        if doc_id in self:
+            self.remove([doc_id])
+
+        counts = dict(Counter(tokenize(text)))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = counts
+        length = sum(counts.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+        self._num_docs += 1
+
+    def add_documents(self, ids: Iterable[str], documents: Iterable[Document]):
+        for doc_id, doc in zip(ids, documents):
+            self.add(doc_id, doc.page_content)
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        """Remove chunks by id. Returns the number of chunks actually removed."""
+        removed = 0
+        candidates = []
+        for doc_id in doc_ids:
+            counts = self._doc_terms.pop(doc_id, None)
+            if counts is None:
+                candidates.append(doc_id)
+                continue
+            for term in counts:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_len -= self._doc_len.pop(doc_id)
+            removed += 1
+
+        for i, base in enumerate(self._bases):
+            if not candidates:
+                break
+            rows = base.rows(candidates)
+            candidates = [doc_id for doc_id, row in zip(candidates, rows) if row < 0]
+            rows = np.unique(rows[rows >= 0])
+            if self._tombstones[i] is not None:
+                rows = rows[~self._tombstones[i].dead[rows]]
+            if not len(rows):
+                continue
+            tombstones = self._own_tombstones(i)
+            tombstones.dead[rows] = True
+            terms = np.asarray(base.fwd_terms)[_ranges(base.fwd_indptr[rows], base.fwd_indptr[rows + 1])]
+            tombstones.df += np.bincount(terms, minlength=len(tombstones.df)).astype(np.int32)
+            length = int(base.doc_len[rows].sum())
+            tombstones.count += len(rows)
+            tombstones.length += length
+            self._total_len -= length
+            removed += len(rows)
+
+        self._num_docs -= removed
+        return removed
+
+    def _own_tombstones(self, i: int) -> _Tombstones:
+        """Tombstones of base i that this index may modify."""
+        if self._tombstones[i] is None:
+            self._tombstones[i] = _Tombstones(self._bases[i])
+        elif self._shared[i]:
+            self._tombstones[i] = self._tombstones[i].copy()
+        self._shared[i] = False
+        return self._tombstones[i]
+
+    def _df(self, term: str, term_ids: List[int]) -> int:
+        df = len(self._postings.get(term, ()))
+        for base, tombstones, term_id in zip(self._bases, self._tombstones, term_ids):
+            if term_id >= 0:
+                df += base.df(term_id) - (int(tombstones.df[term_id]) if tombstones is not None else 0)
+        return df
+
+    def idf(self, term: str) -> float:
+        return self._idf(self._df(term, [int(base.term_ids([term])[0]) for base in self._bases]))
+
+    def _idf(self, df: int) -> float:
+        return math.log(1.0 + (self._num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 50, allowed: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Returns up to k (doc_id, score) pairs ordered by descending BM25 score.
+
+        With `allowed`, only those doc ids are scored; idf and document
+        length statistics still cover the whole corpus.
+        """
+        if not self._num_docs or k <= 0:
+            return []
+        allowed_rows = None
+        if allowed is not None:
+            allowed = allowed if isinstance(allowed, (set, frozenset)) else set(allowed)
+            if not allowed:
+                return []
+            allowed_list = list(allowed)
+            allowed_rows = [np.sort(rows[rows >= 0]) for rows in (base.rows(allowed_list) for base in self._bases)]
+
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        base_term_ids = [base.term_ids(terms) for base in self._bases]
+        avg_len = self.avg_doc_len or 1.0
+        k1, b = self.k1, self.b
+
+        base_rows = [[] for _ in self._bases]
+        base_scores = [[] for _ in self._bases]
+        delta_scores: Dict[str, float] = {}
+        for t, term in enumerate(terms):
+            term_ids = [int(ids[t]) for ids in base_term_ids]
+            idf = self._idf(self._df(term, term_ids))
+            for i, (base, term_id) in enumerate(zip(self._bases, term_ids)):
+                if term_id < 0:
+                    continue
+                lo, hi = int(base.indptr[term_id]), int(base.indptr[term_id + 1])
+                rows = base.post_rows[lo:hi]
+                tf = base.post_tfs[lo:hi].astype(np.float64)
+                norm = k1 * (1 - b + b * base.doc_len[rows] / avg_len)
+                base_rows[i].append(rows)
+                base_scores[i].append(idf * tf * (k1 + 1) / (tf + norm))
+            for doc_id, tf in self._postings.get(term, {}).items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = k1 * (1 - b + b * self._doc_len[doc_id] / avg_len)
+                delta_scores[doc_id] = delta_scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        results = heapq.nlargest(k, delta_scores.items(), key=lambda item: item[1])
+        for i, base in enumerate(self._bases):
+            if not base_rows[i]:
+                continue
+            rows, inverse = np.unique(np.concatenate(base_rows[i]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(base_scores[i]))
+            if self._tombstones[i] is not None:
+                live = ~self._tombstones[i].dead[rows]
+                rows, scores = rows[live], scores[live]
+            if allowed_rows is not None:
+                keep = np.isin(rows, allowed_rows[i], assume_unique=True)
+                rows, scores = rows[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            results.extend((base.doc_ids[row].decode("utf-8"), float(score)) for row, score in zip(rows, scores))
+        return heapq.nlargest(k, results, key=lambda item: item[1])
+
+    def compact(self) -> Optional[KeywordSegment]:
+        """Merges the live rows of every segment and the delta into one new
+        segment (None when no chunk is left). Existing segments are not modified."""
+        id_parts, len_parts, row_parts, tf_parts = [], [], [], []
+        # (vocab the term ids refer to, term ids) per part
+        term_parts = []
+        offset = 0
+        for i, base in enumerate(self._bases):
+            if not len(base):
+                continue
+            keep = np.ones(len(base), dtype=bool)
+            if self._tombstones[i] is not None:
+                keep &= ~self._tombstones[i].dead
+            counts = np.diff(base.fwd_indptr)
+            entry_keep = np.repeat(keep, counts)
+            old_rows = np.repeat(np.arange(len(base)), counts)[entry_keep]
+            row_parts.append(offset + (np.cumsum(keep) - 1)[old_rows])
+            term_parts.append((np.asarray(base.vocab), np.asarray(base.fwd_terms)[entry_keep]))
+            tf_parts.append(np.asarray(base.fwd_tfs)[entry_keep].astype(np.int64))
+            id_parts.append(np.asarray(base.doc_ids)[keep])
+            len_parts.append(np.asarray(base.doc_len)[keep])
+            offset += int(keep.sum())
+
+        delta_ids = list(self._doc_terms)
+        delta_rows, delta_terms, delta_tfs = [], [], []
+        for row, doc_id in enumerate(delta_ids, start=offset):
+            for term, tf in self._doc_terms[doc_id].items():
+                delta_rows.append(row)
+                delta_terms.append(term)
+                delta_tfs.append(tf)
+        delta_terms = _encode(delta_terms)
+        id_parts.append(_encode(delta_ids))
+        len_parts.append(np.array([self._doc_len[d] for d in delta_ids], dtype=np.int32))
+        row_parts.append(np.array(delta_rows, dtype=np.int64))
+        tf_parts.append(np.array(delta_tfs, dtype=np.int64))
+
+        ids = np.concatenate(id_parts)
+        if not len(ids):
+            return None
+        lens = np.concatenate(len_parts)
+
+        vocab = np.unique(np.concatenate([v for v, _ in term_parts] + [delta_terms]))
+        terms = np.concatenate(
+            [np.searchsorted(vocab, v)[t] for v, t in term_parts]
+            + [np.searchsorted(vocab, delta_terms)]
+        ).astype(np.int64)
+        # Drop terms whose only postings were tombstoned
+        used = np.unique(terms)
+        vocab, terms = vocab[used], np.searchsorted(used, terms)
+
+        order = np.argsort(ids, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        rows = rank[np.concatenate(row_parts)]
+        tfs = np.concatenate(tf_parts)
+
+        fwd = np.lexsort((terms, rows))
+        inv = np.lexsort((rows, terms))
+        arrays = {
+            "vocab": vocab,
+            "indptr": np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(vocab)))]).astype(np.int64),
+            "post_rows": rows[inv].astype(np.int32),
+            "post_tfs": tfs[inv].astype(np.int32),
+            "doc_ids": ids[order],
+            "doc_len": lens[order].astype(np.int32),
+            "fwd_indptr": np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(ids)))]).astype(np.int64),
+            "fwd_terms": terms[fwd].astype(np.int32),
+            "fwd_tfs": tfs[fwd].astype(np.int32),
+        }
+        return KeywordSegment(arrays, int(lens.sum()))
@@ -6,6 +6,11 @@ from loguru import logger
 from app.core.config import settings
 from app.services.prompts import get_sys_prompt
 
+# Chat history messages included in the prompt
+PROMPT_HISTORY_TURNS = 5
+# Streamed in place of (or after part of) an answer when the LLM call fails
+LLM_ERROR_PREFIX = "I'm sorry, I encountered an error"
+
 class LLMService:
     def __init__(self):
         self.llm = ChatGroq(
@@ -25,7 +30,7 @@ class LLMService:
         """Generates a streaming response from Groq LLM."""
         
         # Format chat history for prompt
-        history_str = "\n".join([f"{m['role']}: {m['content']}" for m in chat_history[-5:]]) if chat_history else "No previous history."
+        history_str = "\n".join([f"{m['role']}: {m['content']}" for m in chat_history[-PROMPT_HISTORY_TURNS:]]) if chat_history else "No previous history."
         
         # If no context provided, return the required fallback immediately
         if not context or not context.strip():
@@ -68,6 +73,6 @@ class LLMService:
             logger.info(f"LLM Response generated successfully. Length: {len(full_response)}")
         except Exception as e:
             logger.error(f"Error calling LLM: {str(e)}")
-            yield f"I'm sorry, I encountered an error: {str(e)}"
+            yield f"{LLM_ERROR_PREFIX}: {str(e)}"
 
 llm_service = LLMService()
@@ -10,6 +10,9 @@ _metrics: Dict[str, Any] = {
     "last_rerank_time": None,
     "generation_samples": [],
     "last_generation_time": None,
+    "rerank_cascade_samples": [],
+    "retrieval_cache_hits": 0,
+    "retrieval_cache_misses": 0,
 }
 
 
@@ -29,6 +32,22 @@ def record_rerank(latency: float):
         _metrics["last_rerank_time"] = latency
 
 
+def record_rerank_cascade(depth: int, candidates: int, seconds_saved: float):
+    """One cascaded rerank: chunks scored by the cross-encoder out of `candidates`,
+    and the estimated scoring time the skipped ones would have cost."""
+    with _lock:
+        _metrics["rerank_cascade_samples"].append(
+            {"depth": depth, "candidates": candidates, "saved": seconds_saved}
+        )
+        if len(_metrics["rerank_cascade_samples"]) > 100:
+            _metrics["rerank_cascade_samples"] = _metrics["rerank_cascade_samples"][-100:]
+
+
+def record_retrieval_cache(hit: bool):
+    with _lock:
+        _metrics["retrieval_cache_hits" if hit else "retrieval_cache_misses"] += 1
+
+
 def record_generation(latency: float):
     with _lock:
         _metrics["last_generation_time"] = latency
@@ -41,6 +60,8 @@ def get_metrics() -> Dict[str, Any]:
     with _lock:
         # compute average retrieval latency from samples
         samples = list(_metrics["retrieval_samples"])
+        cascade_samples = list(_metrics["rerank_cascade_samples"])
+        cache_hits, cache_misses = _metrics["retrieval_cache_hits"], _metrics["retrieval_cache_misses"]
     avg = None
     if samples:
         avg = sum(s["latency"] for s in samples) / len(samples)
@@ -57,5 +78,19 @@ def get_metrics() -> Dict[str, Any]:
         "last_rerank_time": _metrics.get("last_rerank_time"),
         "avg_generation_time": avg_gen,
         "last_generation_time": _metrics.get("last_generation_time"),
+        "avg_rerank_depth": (
+            sum(s["depth"] for s in cascade_samples) / len(cascade_samples) if cascade_samples else None
+        ),
+        "avg_rerank_candidates": (
+            sum(s["candidates"] for s in cascade_samples) / len(cascade_samples) if cascade_samples else None
+        ),
+        "avg_rerank_time_saved": (
+            sum(s["saved"] for s in cascade_samples) / len(cascade_samples) if cascade_samples else None
+        ),
+        "retrieval_cache_hits": cache_hits,
+        "retrieval_cache_misses": cache_misses,
+        "retrieval_cache_hit_rate": (
+            cache_hits / (cache_hits + cache_misses) if cache_hits + cache_misses else None
+        ),
     }
     return data
@@ -0,0 +1,119 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.services.executors import StageExecutor, rerank_executor, search_executor
+from app.services.faiss_service import faiss_service
+from app.services.reranker import reranker
+from app.services.search_filter import SearchFilter
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls for the same key within `window_ms` into one `run_batch` call."""
+
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]], window_ms: float, max_batch: int):
+        self._run_batch = run_batch
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self.requests = 0
+        self.batches = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        self.requests += 1
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            self.batches += 1
+            asyncio.ensure_future(self._dispatch(key, batch))
+
+    async def _dispatch(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self._run_batch(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class QueryScheduler:
+    """Micro-batching front that answers concurrent searches and reranks with one batched call."""
+
+    def __init__(self, search_stage: StageExecutor, rerank_stage: StageExecutor, window_ms: float, max_batch: int):
+        self.search_stage = search_stage
+        self.rerank_stage = rerank_stage
+        self._searches = MicroBatcher(self._run_searches, window_ms, max_batch)
+        self._reranks = MicroBatcher(self._run_reranks, window_ms, max_batch)
+
+    async def search(
+        self, query: str, k: int, search_filter: Optional[SearchFilter] = None, with_scores: bool = False
+    ) -> List[Any]:
+        """Top-k chunks for `query`; (Document, fused score) pairs with `with_scores`."""
+        # Only searches for the same k share a batch; the candidate depth depends on it
+        hits = await self._searches.submit(k, (query, search_filter))
+        return hits if with_scores else [doc for doc, _ in hits]
+
+    async def rerank(
+        self, query: str, documents: List[Document], top_n: int, scores: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Cross-encoder top_n of `documents`. Given their fused `scores`, the
+        rerank is cascaded (see EnterpriseReranker.rerank_cascade_many)."""
+        if not documents:
+            return []
+        if scores is not None and settings.RERANK_CASCADE:
+            return await self._reranks.submit(("cascade", top_n), (query, list(zip(documents, scores)), top_n))
+        return await self._reranks.submit(None, (query, documents, top_n))
+
+    async def _run_searches(self, k: int, requests: List[Tuple[str, Optional[SearchFilter]]]) -> List[List[Any]]:
+        queries = [query for query, _ in requests]
+        search_filters = [search_filter for _, search_filter in requests]
+        return await self.search_stage.run(
+            faiss_service.similarity_search_many, queries, k=k, search_filters=search_filters, with_scores=True
+        )
+
+    async def _run_reranks(self, key, requests: List[Tuple[str, List[Any], int]]) -> List[List[Document]]:
+        if key is not None:
+            # Cascades of the same top_n
+            return await self.rerank_stage.run(
+                reranker.rerank_cascade_many, [query for query, _, _ in requests],
+                [candidates for _, candidates, _ in requests], top_n=key[1],
+            )
+        # Reranked lists are sorted, so one pass at the largest top_n serves every request
+        top_n = max(top_n for _, _, top_n in requests)
+        ranked = await self.rerank_stage.run(
+            reranker.rerank_many, [query for query, _, _ in requests], [docs for _, docs, _ in requests], top_n=top_n
+        )
+        return [docs[:top_n] for docs, (_, _, top_n) in zip(ranked, requests)]
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"search": self._searches.stats(), "rerank": self._reranks.stats()}
+
+
+query_scheduler = QueryScheduler(
+    search_executor, rerank_executor, settings.QUERY_BATCH_WINDOW_MS, settings.QUERY_BATCH_MAX
+)
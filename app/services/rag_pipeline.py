@@ -4,7 +4,11 @@ from langchain_core.documents import Document
 from loguru import logger
 from app.services.faiss_service import faiss_service
 from app.core.config import settings
-from app.services.reranker import reranker
+from app.services.executors import search_executor
+from app.services.metrics import record_retrieval_cache
+from app.services.query_scheduler import query_scheduler
+from app.services.retrieval_cache import retrieval_cache
+from app.services.search_filter import SearchFilter
 # Import llm_service cleanly to avoid circular dependency issues at module level if any
 # We will use lazy import inside methods if needed, but top level is likely fine given dependency graph.
 from app.services.llm_service import llm_service
@@ -26,22 +30,18 @@ class RagRetriever:
         query_lower = query.lower()
         return any(keyword in query_lower for keyword in resume_keywords)
 
-    def _get_unique_resumes(self) -> List[str]:
-        """Fetch unique file names that look like resumes from the vector store."""
-        if not faiss_service.vector_db:
-            return []
-        
-        all_docs = faiss_service.vector_db.docstore._dict.values()
+    def _get_unique_resumes(self, files: List[str]) -> List[str]:
+        """Pick the unique file names that look like resumes out of `files`."""
         resumes = set()
         resume_exts = {'.pdf', '.docx', '.txt'} # Common resume files
         
-        for doc in all_docs:
-            source = doc.metadata.get("file_name", "").lower()
+        for file_name in files:
+            source = file_name.lower()
             if any(k in source for k in ['resume', 'cv', 'profile', 'candidate']) or \
                any(source.endswith(ext) for ext in resume_exts):
                 # Filter out obvious non-resumes like tutorials if they were indexed
                 if 'pattern' not in source and 'tutorial' not in source:
-                    resumes.add(doc.metadata["file_name"])
+                    resumes.add(file_name)
         
         return list(resumes)
 
@@ -89,51 +89,62 @@ class RagRetriever:
                 entities.append(clean_word)
         return entities
 
-    def retrieve_for_comparison(self, query: str, entities: list) -> List[Document]:
+    async def retrieve_for_comparison(self, query: str, entities: list) -> List[Document]:
         """Specialized retrieval for comparison queries with file scoping."""
         all_docs = []
         seen_ids = set() 
         
         is_resume_q = self._is_resume_query(query)
-        
+        # The file list includes a SQLite lookup of deduplicated files; keep it off the event loop
+        files = await search_executor.run(faiss_service.list_files)
+
         # If no specific entities found but it's a resume comparison, use all resumes
         if not entities and is_resume_q:
-            entities = self._get_unique_resumes()
+            entities = self._get_unique_resumes(files)
             logger.info(f"No specific entities found for resume comparison. Using all discovered resumes: {entities}")
 
+        entity_queries, search_filters = [], []
         for entity in entities:
-            # Source scoping: filter candidates by entity name in filename/content
             entity_query = f"{entity} experience skills background"
             if is_resume_q:
                 entity_query = f"{entity} resume CV highlights"
+            entity_queries.append(entity_query)
 
-            logger.info(f"Retrieving for entity: {entity}")
-            
-            # Initial search with higher recall for the specific entity
-            base_docs = faiss_service.similarity_search(entity_query, k=50)
-            
-            # HARD FILTER: Ensure docs belong to the entity or document scope
-            entity_docs = []
-            for d in base_docs:
-                source = d.metadata.get("file_name", "").lower()
-                content = d.page_content.lower()
-                if entity.lower() in source or entity.lower() in content:
-                    entity_docs.append(d)
-                # If it's a resume query, also allow chunks from resume-named files even if name match fails
-                elif is_resume_q and ('resume' in source or 'cv' in source):
-                    entity_docs.append(d)
-
-            if entity_docs:
-                # Rerank the filtered set
-                reranked_docs = reranker.rerank(entity_query, entity_docs, top_n=7)
-                added = 0
-                for doc in reranked_docs:
-                    uid = doc.metadata.get("chunk_id") or f"{doc.metadata.get('source')}_{doc.metadata.get('page')}_{hash(doc.page_content[:50])}"
-                    if uid not in seen_ids:
-                        all_docs.append(doc)
-                        seen_ids.add(uid)
-                        added += 1
-                        if added >= 5: break
+            # Scope the search itself to the entity's files (or, for resume questions,
+            # to resume-named files) instead of filtering a global top 50 afterwards
+            scope = [f for f in files if entity.lower() in f.lower()]
+            if not scope and is_resume_q:
+                scope = [f for f in files if 'resume' in f.lower() or 'cv' in f.lower()]
+            search_filters.append(SearchFilter(file_names=scope) if scope else None)
+
+        logger.info(f"Retrieving for entities: {entities}")
+        # Submitted together, the entity searches (and then the reranks) land in one
+        # scheduler batch: one embedding call and one FAISS pass for all entities
+        candidates = list(await asyncio.gather(*(
+            query_scheduler.search(entity_query, 50, search_filter, with_scores=True)
+            for entity_query, search_filter in zip(entity_queries, search_filters)
+        )))
+        for i, entity in enumerate(entities):
+            if search_filters[i] is None:
+                # No file to scope to: keep global candidates that mention the entity
+                candidates[i] = [
+                    (d, score) for d, score in candidates[i]
+                    if entity.lower() in d.metadata.get("file_name", "").lower() or entity.lower() in d.page_content.lower()
+                ]
+
+        reranked = await asyncio.gather(*(
+            query_scheduler.rerank(entity_query, [d for d, _ in hits], top_n=7, scores=[score for _, score in hits])
+            for entity_query, hits in zip(entity_queries, candidates)
+        ))
+        for reranked_docs in reranked:
+            added = 0
+            for doc in reranked_docs:
+                uid = doc.metadata.get("chunk_id") or f"{doc.metadata.get('source')}_{doc.metadata.get('page')}_{hash(doc.page_content[:50])}"
+                if uid not in seen_ids:
+                    all_docs.append(doc)
+                    seen_ids.add(uid)
+                    added += 1
+                    if added >= 5: break
 
         return all_docs[:self.top_n]
 
@@ -164,36 +175,63 @@ class RagRetriever:
     async def retrieve(self, query: str) -> List[Document]:
         """Enhanced retrieval pipeline with intent-based filtering."""
         query = await self._translate_query_if_needed(query)
-        
+        if retrieval_cache is None:
+            return await self._retrieve(query)
+
+        # Until the index changes, the same query with the same intent retrieves the same chunks.
+        # A changed manifest is loaded before answering, so that happens off the event loop.
+        generation = await search_executor.run(faiss_service.latest_generation)
+        if generation is None:
+            return await self._retrieve(query)
+        flags = (self._is_comparison_query(query), self._is_visual_query(query), self._is_resume_query(query))
+        chunk_ids = retrieval_cache.get(query, flags, generation)
+        if chunk_ids is not None:
+            docs = [faiss_service.get_chunk(chunk_id) for chunk_id in chunk_ids]
+            if all(doc is not None for doc in docs):
+                record_retrieval_cache(True)
+                return docs
+        record_retrieval_cache(False)
+
+        docs = await self._retrieve(query)
+        chunk_ids = [doc.metadata.get("chunk_id") for doc in docs]
+        if all(chunk_ids):
+            retrieval_cache.put(query, flags, generation, chunk_ids)
+        return docs
+
+    async def _retrieve(self, query: str) -> List[Document]:
         # 1. Comparison Queries
         if self._is_comparison_query(query):
             entities = self._extract_entities(query)
             # If no entities but is resume query, or if entities found
             if entities or self._is_resume_query(query):
-                return self.retrieve_for_comparison(query, entities)
+                return await self.retrieve_for_comparison(query, entities)
         
         # 2. Standard Retrieval with File Scoping
         is_visual = self._is_visual_query(query)
         is_resume = self._is_resume_query(query)
         
         fetch_k = 100 if (is_visual or is_resume) else self.top_k
-        base_docs = faiss_service.similarity_search(query, k=fetch_k)
+        # Embedding, search and reranking run batched with other sessions' queries, off the event loop
+        hits = await query_scheduler.search(query, fetch_k, with_scores=True)
         
-        if not base_docs:
+        if not hits:
             return []
 
         # Intent Filtering: If resume query, remove unrelated technical docs early
         if is_resume:
-            filtered = [d for d in base_docs if 'pattern' not in d.metadata.get('file_name', '').lower()]
-            if filtered: base_docs = filtered
+            filtered = [(d, s) for d, s in hits if 'pattern' not in d.metadata.get('file_name', '').lower()]
+            if filtered: hits = filtered
 
         # Visual Prioritization
         if is_visual:
-            visual_docs = [d for d in base_docs if d.metadata.get("image_url")]
-            other_docs = [d for d in base_docs if not d.metadata.get("image_url")]
-            base_docs = visual_docs + other_docs
+            visual_hits = [(d, s) for d, s in hits if d.metadata.get("image_url")]
+            other_hits = [(d, s) for d, s in hits if not d.metadata.get("image_url")]
+            hits = visual_hits + other_hits
 
-        final_docs = reranker.rerank(query, base_docs, top_n=self.top_n)
+        # Fused scores let the reranker skip candidates that cannot reach the top_n
+        final_docs = await query_scheduler.rerank(
+            query, [d for d, _ in hits], top_n=self.top_n, scores=[s for _, s in hits]
+        )
         return final_docs
 
     async def get_relevant_context(self, query: str) -> str:
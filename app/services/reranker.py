@@ -1,10 +1,46 @@
-from typing import List
-from flashrank import Ranker, RerankRequest
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from flashrank import Ranker
 from langchain_core.documents import Document
 from loguru import logger
+from app.core.config import settings
+from app.services.dedup import content_hash
+from app.services.embedding_cache import normalize_query
+
+def uncertain_band(scores: np.ndarray, top_n: int, margin: float) -> int:
+    """Length of the candidate prefix the cross-encoder has to look at.
+
+    Fused scores are min-max normalized; a candidate more than `margin`
+    below the top_n-th best cannot plausibly reach the top_n, so the band
+    ends after the last candidate within the margin. Without any score
+    separation every candidate is uncertain.
+    """
+    n = len(scores)
+    if n <= top_n:
+        return n
+    hi, lo = scores.max(), scores.min()
+    if hi <= lo:
+        return n
+    norm = (scores - lo) / (hi - lo)
+    cutoff = np.sort(norm)[::-1][top_n - 1] - margin
+    return max(top_n, int(np.flatnonzero(norm >= cutoff)[-1]) + 1)
+
+
+def _chunk_key(doc: Document) -> str:
+    # Chunk ids are minted per chunk and never reused for other text
+    return doc.metadata.get("chunk_id") or content_hash(doc.page_content)
+
 
 class EnterpriseReranker:
     def __init__(self, model_name: str = "ms-marco-TinyBERT-L-2-v2"):
+        # Cross-encoder scores by (normalized query, chunk id), most recent last
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._scores_lock = threading.Lock()
+        self.score_hits = 0
+        self.score_misses = 0
         try:
             self.ranker = Ranker(model_name=model_name, cache_dir="db/flashrank_cache")
             logger.info(f"Initialized FlashRanker: {model_name}")
@@ -16,17 +52,158 @@ class EnterpriseReranker:
         """Rerank retrieved chunks for relevance."""
         if not self.ranker or not documents:
             return documents[:top_n]
+        return self.rerank_many([query], [documents], top_n=top_n)[0]
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+        """FlashRank relevance of each (query, passage) pair.
+
+        Same tokenization, model and sigmoid as Ranker.rerank, but pairs of
+        any number of queries go through the ONNX session together, in
+        batches of RERANK_BATCH_SIZE sorted by length so each batch pads to
+        little more than its own longest pair.
+        """
+        scores = np.zeros(len(pairs), dtype=np.float64)
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        batch_size = max(1, settings.RERANK_BATCH_SIZE)
+        inputs = {i.name for i in self.ranker.session.get_inputs()}
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            encodings = self.ranker.tokenizer.encode_batch([list(pairs[i]) for i in batch])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            logits = self.ranker.session.run(None, {name: value for name, value in feed.items() if name in inputs})[0]
+            logits = logits[:, 1] if logits.shape[1] > 1 else logits.flatten()
+            scores[batch] = 1 / (1 + np.exp(-logits))
+        return scores
+
+    def score_documents_many(self, items: Sequence[Tuple[str, Document]]) -> np.ndarray:
+        """Cross-encoder score of each (query, chunk), through the score cache.
+
+        Scores are kept in an LRU of RERANK_SCORE_CACHE_SIZE entries keyed by
+        normalized query and chunk id, so repeated and refined questions, and
+        comparison searches with overlapping candidates, only score the
+        pairs they have not seen.
+        """
+        keys = [(normalize_query(query), _chunk_key(doc)) for query, doc in items]
+        scores = np.empty(len(items), dtype=np.float64)
+        missing: Dict[Tuple[str, str], List[int]] = {}
+        with self._scores_lock:
+            for i, key in enumerate(keys):
+                score = self._scores.get(key)
+                if score is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._scores.move_to_end(key)
+                    scores[i] = score
+            self.score_hits += len(items) - sum(len(positions) for positions in missing.values())
+            self.score_misses += len(missing)
+        if not missing:
+            return scores
+
+        computed = self.score_pairs([(key[0], items[positions[0]][1].page_content) for key, positions in missing.items()])
+        capacity = settings.RERANK_SCORE_CACHE_SIZE
+        with self._scores_lock:
+            for (key, positions), score in zip(missing.items(), computed.tolist()):
+                scores[positions] = score
+                if capacity > 0:
+                    self._scores[key] = score
+                    self._scores.move_to_end(key)
+            while len(self._scores) > max(0, capacity):
+                self._scores.popitem(last=False)
+        return scores
 
-        passages = [
-            {"id": i, "text": doc.page_content, "meta": doc.metadata}
-            for i, doc in enumerate(documents)
+    def score_cache_stats(self) -> Dict[str, float]:
+        with self._scores_lock:
+            lookups = self.score_hits + self.score_misses
+            return {
+                "entries": len(self._scores),
+                "capacity": settings.RERANK_SCORE_CACHE_SIZE,
+                "hits": self.score_hits,
+                "misses": self.score_misses,
+                "hit_rate": round(self.score_hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def rerank_many(
+        self, queries: Sequence[str], document_lists: Sequence[List[Document]], top_n: int = 5
+    ) -> List[List[Document]]:
+        """rerank for several (query, candidates) pairs with one round of model inference."""
+        if not self.ranker:
+            return [documents[:top_n] for documents in document_lists]
+
+        items = [(query, doc) for query, documents in zip(queries, document_lists) for doc in documents]
+        if not items:
+            return [[] for _ in document_lists]
+        scores = self.score_documents_many(items)
+
+        results, offset = [], 0
+        for documents in document_lists:
+            own = scores[offset:offset + len(documents)]
+            offset += len(documents)
+            ranked = sorted(range(len(documents)), key=lambda i: own[i], reverse=True)
+            results.append([documents[i] for i in ranked[:top_n]])
+        return results
+
+    def rerank_cascade_many(
+        self, queries: Sequence[str], candidate_lists: Sequence[List[Tuple[Document, float]]], top_n: int = 5
+    ) -> List[List[Document]]:
+        """Reranks only as much of each candidate list as can change its top_n.
+
+        Candidates come in priority order with their fused retrieval scores.
+        Each list is cut to its uncertain band (see uncertain_band), and the
+        band is reranked in steps of RERANK_CASCADE_STEP: the first step
+        covers at least top_n candidates; after every further step the list
+        stops once its reranked top_n is unchanged. Steps of all lists are
+        scored together. Returns the reranked top_n of each list.
+        """
+        if not self.ranker:
+            return [[doc for doc, _ in candidates[:top_n]] for candidates in candidate_lists]
+
+        step = max(1, settings.RERANK_CASCADE_STEP)
+        bands = [
+            uncertain_band(np.array([score for _, score in candidates], dtype=np.float64), top_n, settings.RERANK_CASCADE_MARGIN)
+            for candidates in candidate_lists
         ]
+        ce_scores = [np.full(len(candidates), -np.inf) for candidates in candidate_lists]
+        depth = [0] * len(candidate_lists)
+        tops: List[Tuple[int, ...]] = [()] * len(candidate_lists)
+        active = {i for i, band in enumerate(bands) if band}
+        scored_pairs, scoring_time = 0, 0.0
+
+        while active:
+            jobs = []
+            for i in sorted(active):
+                size = max(step, top_n) if depth[i] == 0 else step
+                jobs.append((i, depth[i], min(bands[i], depth[i] + size)))
+            items = [(queries[i], candidate_lists[i][j][0]) for i, lo, hi in jobs for j in range(lo, hi)]
+            start = time.perf_counter()
+            scores = self.score_documents_many(items)
+            scoring_time += time.perf_counter() - start
+            scored_pairs += len(items)
+
+            offset = 0
+            for i, lo, hi in jobs:
+                ce_scores[i][lo:hi] = scores[offset:offset + hi - lo]
+                offset += hi - lo
+                depth[i] = hi
+                top = tuple(np.argsort(-ce_scores[i][:hi], kind="stable")[:top_n].tolist())
+                if hi >= bands[i] or (lo > 0 and top == tops[i]):
+                    active.discard(i)
+                tops[i] = top
+
+        try:
+            from app.services.metrics import record_rerank_cascade
+            per_pair = scoring_time / scored_pairs if scored_pairs else 0.0
+            for candidates, reranked in zip(candidate_lists, depth):
+                record_rerank_cascade(reranked, len(candidates), (len(candidates) - reranked) * per_pair)
+        except Exception:
+            pass
 
-        results = self.ranker.rerank(RerankRequest(query=query, passages=passages))
-        
         return [
-            Document(page_content=res["text"], metadata=res["meta"])
-            for res in results[:top_n]
+            [candidates[j][0] for j in np.argsort(-ce[:d], kind="stable")[:top_n]]
+            for candidates, ce, d in zip(candidate_lists, ce_scores, depth)
         ]
 
 reranker = EnterpriseReranker()
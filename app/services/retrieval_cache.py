@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+from app.core.config import settings
+from app.services.embedding_cache import normalize_query
+
+
+class RetrievalCache:
+    """LRU of the ranked chunk ids retrieved per (normalized query, intent flags), valid for one index generation."""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._results: "OrderedDict[Tuple[str, Hashable], Tuple[float, List[str]]]" = OrderedDict()
+
+    def _sync_generation(self, generation: int) -> bool:
+        """Moves to `generation` if it is newer; False if it is already outdated."""
+        if self._generation is not None and generation < self._generation:
+            return False
+        if self._generation != generation:
+            self._generation = generation
+            self._results.clear()
+        return True
+
+    def get(self, query: str, flags: Hashable, generation: int) -> Optional[List[str]]:
+        key = (normalize_query(query), flags)
+        with self._lock:
+            if not self._sync_generation(generation):
+                return None
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            created, chunk_ids = entry
+            if time.monotonic() - created > self.ttl:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return chunk_ids
+
+    def put(self, query: str, flags: Hashable, generation: int, chunk_ids: List[str]):
+        key = (normalize_query(query), flags)
+        with self._lock:
+            # A retrieval that raced with an index change must not be cached
+            if not self._sync_generation(generation):
+                return
+            self._results[key] = (time.monotonic(), chunk_ids)
+            self._results.move_to_end(key)
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"entries": len(self._results), "capacity": self.capacity, "generation": self._generation}
+
+
+retrieval_cache = (
+    RetrievalCache(settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL) if settings.RETRIEVAL_CACHE_SIZE else None
+)
@@ -0,0 +1,68 @@
+from typing import Iterable, Optional
+import numpy as np
+
+
+def _document_type(value: Optional[str]) -> str:
+    """".PDF", "pdf" and "pdf " all name the same type."""
+    return (value or "").strip().lower().lstrip(".")
+
+
+class SearchFilter:
+    """Metadata predicate applied inside the index instead of after it; conditions left as None are not checked."""
+
+    def __init__(
+        self,
+        file_names: Optional[Iterable[str]] = None,
+        document_types: Optional[Iterable[str]] = None,
+        indexed_after: Optional[float] = None,
+        indexed_before: Optional[float] = None,
+        shared_chunk_ids: Optional[Iterable[str]] = None,
+    ):
+        self.file_names = frozenset(file_names) if file_names is not None else None
+        self.document_types = (
+            frozenset(_document_type(t) for t in document_types) if document_types is not None else None
+        )
+        self.indexed_after = indexed_after
+        self.indexed_before = indexed_before
+        # Chunks of other files that the named files also contained (see Deduplicator)
+        self.shared_chunk_ids = frozenset(shared_chunk_ids) if shared_chunk_ids else None
+
+    def __bool__(self) -> bool:
+        return any(c is not None for c in (self.file_names, self.document_types, self.indexed_after, self.indexed_before))
+
+    def __repr__(self) -> str:
+        conditions = {k: v for k, v in vars(self).items() if v is not None}
+        return f"SearchFilter({conditions})"
+
+    def segment_positions(self, segment) -> np.ndarray:
+        """Sorted FAISS positions of the segment's chunks that pass the filter.
+
+        A file_names condition is resolved through the segment's file map,
+        so only the named files' chunks are looked at; the other conditions
+        are evaluated on the segment's cached metadata columns.
+        """
+        if self.file_names is not None:
+            positions = segment.positions(
+                doc_id for name in self.file_names for doc_id in segment.files.get(name, ())
+            )
+            if self.shared_chunk_ids:
+                positions = np.concatenate([positions, segment.positions(self.shared_chunk_ids)])
+            positions = np.unique(positions)
+        else:
+            positions = np.arange(len(segment), dtype=np.int64)
+        if not len(positions):
+            return positions
+
+        keep = np.ones(len(positions), dtype=bool)
+        if self.document_types is not None:
+            types = segment.column("document_type")[positions]
+            keep &= np.fromiter((_document_type(t) in self.document_types for t in types), dtype=bool, count=len(types))
+        if self.indexed_after is not None or self.indexed_before is not None:
+            stamps = np.array(
+                [np.nan if t is None else t for t in segment.column("indexed_at")[positions]], dtype=np.float64
+            )
+            if self.indexed_after is not None:
+                keep &= stamps >= self.indexed_after
+            if self.indexed_before is not None:
+                keep &= stamps <= self.indexed_before
+        return positions[keep]
@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from loguru import logger
+from app.services import vector_index
+from app.services.keyword_index import KeywordIndex, KeywordSegment
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+STAGING_SUFFIX = ".staging"
+# Staging directories older than this belong to a writer that died mid-write
+STAGING_EXPIRY_SECONDS = 3600
+
+
+class Segment:
+    """One immutable slice of the index on disk: FAISS store, keyword postings and file map."""
+
+    def __init__(self, name: str, path: str, store: FAISS, keyword: Optional[KeywordSegment],
+                 files: Dict[str, List[str]], mapped: bool):
+        self.name = name
+        self.path = path
+        self.store = store
+        self.keyword = keyword
+        self.files = files
+        self.mapped = mapped
+        # Built on first use by filtered searches; segments never change, so neither do these
+        self._positions: Optional[Dict[str, int]] = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._aliases: Optional[Dict[str, str]] = None
+
+    def __len__(self) -> int:
+        return self.store.index.ntotal
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.store.docstore._dict
+
+    def ids(self) -> List[str]:
+        return list(self.store.index_to_docstore_id.values())
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        return self.store.docstore._dict.get(doc_id)
+
+    def positions(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """FAISS positions of the given chunk ids that live in this segment."""
+        if self._positions is None:
+            self._positions = {doc_id: pos for pos, doc_id in self.store.index_to_docstore_id.items()}
+        found = [self._positions[doc_id] for doc_id in doc_ids if doc_id in self._positions]
+        return np.asarray(found, dtype=np.int64)
+
+    def chunk_alias(self, chunk_id: str) -> Optional[str]:
+        """Docstore id of the chunk whose metadata chunk_id is `chunk_id`, when the two differ
+        (stores converted from the legacy layout, chunks re-added under a fresh id)."""
+        if self._aliases is None:
+            mapping = self.store.index_to_docstore_id
+            self._aliases = {
+                chunk: mapping[pos] for pos, chunk in enumerate(self.column("chunk_id"))
+                if chunk and chunk != mapping[pos]
+            }
+        return self._aliases.get(chunk_id)
+
+    def column(self, key: str) -> np.ndarray:
+        """Metadata field `key` of every chunk, in FAISS position order (None where missing)."""
+        values = self._columns.get(key)
+        if values is None:
+            mapping, docs = self.store.index_to_docstore_id, self.store.docstore._dict
+            values = np.empty(len(mapping), dtype=object)
+            values[:] = [docs[mapping[pos]].metadata.get(key) for pos in range(len(mapping))]
+            self._columns[key] = values
+        return values
+
+    @classmethod
+    def load(cls, path: str, embeddings, mmap: bool) -> "Segment":
+        store, mapped = vector_index.load_store(path, embeddings, mmap)
+        keyword_path = os.path.join(path, "keyword")
+        keyword = KeywordSegment.load(keyword_path) if os.path.exists(os.path.join(keyword_path, "meta.json")) else None
+        with open(os.path.join(path, "files.json"), "r", encoding="utf-8") as f:
+            files = json.load(f)
+        return cls(os.path.basename(path), path, store, keyword, files, mapped)
+
+    @staticmethod
+    def stage(root: str, store: FAISS, keyword: Optional[KeywordSegment] = None) -> str:
+        """Writes a segment directory under a unique temporary name and returns its path.
+
+        Staging needs no lock; publish() gives the directory its final name
+        once the writer holds the index lock. `keyword` may be passed when the
+        postings are already available (compaction); otherwise they are
+        built from the chunk text.
+        """
+        mapping = store.index_to_docstore_id
+        ids = [mapping[pos] for pos in range(len(mapping))]
+        documents = [store.docstore._dict[doc_id] for doc_id in ids]
+        if keyword is None:
+            keyword = KeywordIndex.from_documents(ids, documents).compact()
+
+        files: Dict[str, List[str]] = {}
+        for doc_id, doc in zip(ids, documents):
+            file_name = doc.metadata.get("file_name")
+            if file_name:
+                files.setdefault(file_name, []).append(doc_id)
+
+        path = os.path.join(root, f"{uuid.uuid4().hex}{STAGING_SUFFIX}")
+        vector_index.save_store(store, path)
+        if keyword is not None:
+            os.makedirs(os.path.join(path, "keyword"))
+            keyword.write(os.path.join(path, "keyword"))
+        with open(os.path.join(path, "files.json"), "w", encoding="utf-8") as f:
+            json.dump(files, f)
+        return path
+
+    @classmethod
+    def publish(cls, staging_path: str, name: str, embeddings, mmap: bool) -> "Segment":
+        """Renames a staged directory to its segment name and loads it.
+
+        Call with the write lock held and a name the manifest does not
+        reference. A directory already under that name was published by a
+        writer that died before committing its manifest, and is replaced.
+        """
+        path = os.path.join(os.path.dirname(staging_path), name)
+        if os.path.exists(path):
+            logger.warning(f"Replacing uncommitted segment directory {name} left by an interrupted write.")
+            shutil.rmtree(path)
+        os.rename(staging_path, path)
+        return cls.load(path, embeddings, mmap)
+
+
+def build_store(
+    ids: Sequence[str], documents: Sequence[Document], vectors: np.ndarray, embeddings, corpus: Optional[int] = None
+) -> FAISS:
+    """An in-memory FAISS store over precomputed vectors.
+
+    The layout follows target_spec for the size of the whole corpus
+    (`corpus` live chunks, including these), so every segment gets the
+    configured ANN / quantized index once the corpus is large enough,
+    however it is split into segments.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index = vector_index.build_index(vector_index.target_spec(n, dim, corpus), vectors, dim)
+    return FAISS(embeddings, index, InMemoryDocstore(dict(zip(ids, documents))), dict(enumerate(ids)))
+
+
+def segment_name(number: int) -> str:
+    return f"seg-{number:06d}"
+
+
+def read_manifest(index_path: str) -> Optional[Dict[str, Any]]:
+    """The current manifest, or None when the index has not been created yet."""
+    path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported index manifest version: {manifest.get('version')}")
+    return manifest
+
+
+def write_manifest(index_path: str, manifest: Dict[str, Any]):
+    """Replaces the manifest atomically; readers see either the old or the new one."""
+    os.makedirs(index_path, exist_ok=True)
+    path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def remove_orphans(index_path: str, live: Sequence[str]):
+    """Deletes segment directories the manifest no longer references.
+
+    Only safe while holding the index write lock. Staging directories are
+    left alone until they expire, since another process may still be writing
+    one. Processes that still map files of a removed segment keep reading
+    them (POSIX unlink semantics); where the OS refuses, the directory is
+    retried on the next call.
+    """
+    root = os.path.join(index_path, SEGMENTS_DIR)
+    if not os.path.isdir(root):
+        return
+    live = set(live)
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name in live:
+            continue
+        if name.endswith(STAGING_SUFFIX) and now - os.path.getmtime(path) < STAGING_EXPIRY_SECONDS:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class _Ticket:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommit:
+    """Merges concurrent submissions into one commit; each submitter returns once its item is durable."""
+
+    def __init__(self, commit: Callable[[List[Any]], None]):
+        self._commit = commit
+        self._lock = threading.Lock()
+        self._pending: List[Any] = []
+        self._leader_active = False
+
+    def submit(self, item: Any):
+        ticket = _Ticket()
+        with self._lock:
+            self._pending.append((item, ticket))
+            leader = not self._leader_active
+            self._leader_active = True
+        if leader:
+            self._lead()
+        ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+
+    def _lead(self):
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    self._leader_active = False
+                    return
+            error = None
+            try:
+                self._commit([item for item, _ in batch])
+            except BaseException as e:
+                error = e
+            if len(batch) > 1:
+                logger.debug(f"Group-committed {len(batch)} concurrent writes.")
+            for _, ticket in batch:
+                ticket.error = error
+                ticket.done.set()
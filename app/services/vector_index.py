@@ -0,0 +1,229 @@
+import math
+import os
+import pickle
+from typing import Optional, Tuple
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from loguru import logger
+from app.core.config import settings
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+QUANTIZATIONS = ("none", "fp16", "sq8", "pq")
+# (index type, quantization, exact re-rank); the layout every store starts with
+FLAT_SPEC = ("flat", "none", False)
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """The coarse index, looking through an exact re-ranking (IndexRefine) wrapper."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.base_index)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Classifies a FAISS index as "flat", "hnsw" or "ivf"."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    try:
+        faiss.extract_index_ivf(index)
+        return "ivf"
+    except Exception:
+        return "flat"
+
+
+def index_quantization(index: faiss.Index) -> str:
+    """Vector codec of an index: "none" (float32), "fp16", "sq8" or "pq"."""
+    codes = _unwrap(index)
+    if isinstance(codes, faiss.IndexHNSW):
+        codes = faiss.downcast_index(codes.storage)
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def index_spec(index: faiss.Index):
+    """(index type, quantization, exact re-rank) of an index."""
+    refine = isinstance(faiss.downcast_index(index), faiss.IndexRefine)
+    return index_kind(index), index_quantization(index), refine
+
+
+def stores_exact_vectors(index: faiss.Index) -> bool:
+    """Whether extract_vectors returns the original vectors rather than decoded ones."""
+    return index_quantization(index) == "none" or isinstance(faiss.downcast_index(index), faiss.IndexRefine)
+
+
+def extract_vectors(index: faiss.Index) -> np.ndarray:
+    """Reads every stored vector back out of the index (no re-embedding).
+
+    Exact for float32 indices and for quantized ones with exact re-ranking;
+    otherwise these are the decoded (approximate) vectors.
+    """
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    if index_kind(index) != "ivf" or isinstance(faiss.downcast_index(index), faiss.IndexRefine):
+        return index.reconstruct_n(0, index.ntotal)
+    ivf = faiss.extract_index_ivf(index)
+    ivf.make_direct_map()
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        # Drop the temporary direct map again; it costs 8 bytes per vector
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def _ivf_nlist(n: int) -> int:
+    nlist = settings.IVF_NLIST or int(4 * math.sqrt(n))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39))
+
+
+def factory_string(kind: str, quantization: str, refine: bool, n: int) -> str:
+    """faiss.index_factory description for an index type / codec combination."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown vector quantization: {quantization}")
+
+    codec = {
+        "none": "Flat",
+        "fp16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": f"PQ{settings.PQ_M}x{settings.PQ_NBITS}",
+    }[quantization]
+    if kind == "hnsw":
+        description = f"HNSW{settings.HNSW_M}" + ("" if codec == "Flat" else f"_{codec}")
+    elif kind == "ivf":
+        description = f"IVF{_ivf_nlist(n)},{codec}"
+    else:
+        description = codec
+    if refine and quantization != "none":
+        description += ",RFlat"
+    return description
+
+
+def build_index(spec, vectors: np.ndarray, dim: int, metric: int = faiss.METRIC_L2) -> faiss.Index:
+    """Builds an index for `spec` = (type, quantization, exact re-rank) over `vectors`,
+    training coarse centroids / codebooks on them when the layout needs it."""
+    kind, quantization, refine = spec
+    index = faiss.index_factory(dim, factory_string(kind, quantization, refine, len(vectors)), metric)
+    if kind == "hnsw":
+        _unwrap(index).hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    apply_search_params(index)
+    return index
+
+
+def apply_search_params(index: faiss.Index):
+    """Applies the configured efSearch / nprobe / re-rank depth to an index."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        _unwrap(index).hnsw.efSearch = settings.HNSW_EF_SEARCH
+    elif kind == "ivf":
+        faiss.extract_index_ivf(_unwrap(index)).nprobe = settings.IVF_NPROBE
+    outer = faiss.downcast_index(index)
+    if isinstance(outer, faiss.IndexRefine):
+        outer.k_factor = settings.VECTOR_RERANK_FACTOR
+
+
+def filtered_search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Per-query parameters restricting a search to `selector`.
+
+    Per-query parameters replace the index's own efSearch / nprobe / re-rank
+    depth, so the configured values are carried along.
+    """
+    base = _unwrap(index)
+    kind = index_kind(base)
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=settings.HNSW_EF_SEARCH)
+    elif kind == "ivf":
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=settings.IVF_NPROBE)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if isinstance(faiss.downcast_index(index), faiss.IndexRefine):
+        params = faiss.IndexRefineSearchParameters(k_factor=settings.VECTOR_RERANK_FACTOR, base_index_params=params)
+    return params
+
+
+def supports_selector(index: faiss.Index) -> bool:
+    """Whether search() takes an IDSelector; the flat PQ index (IndexPQ) rejects search parameters."""
+    return not isinstance(_unwrap(index), faiss.IndexPQ)
+
+
+def target_spec(ntotal: int, dim: int, corpus: Optional[int] = None):
+    """Layout a store of `ntotal` vectors should use in a corpus of `corpus` live
+    chunks (the store alone by default): plain flat below the migration threshold."""
+    if (ntotal if corpus is None else corpus) < settings.VECTOR_INDEX_MIGRATE_AT:
+        return FLAT_SPEC
+    kind = settings.VECTOR_INDEX_TYPE.lower()
+    quantization = settings.VECTOR_QUANTIZATION.lower()
+    if quantization == "pq" and dim % settings.PQ_M:
+        logger.warning(f"PQ{settings.PQ_M}x{settings.PQ_NBITS} not applicable (dim={dim}); storing float32.")
+        quantization = "none"
+    elif quantization == "pq" and ntotal < 2 ** settings.PQ_NBITS:
+        # Too few vectors to train the codebooks; small segments stay float32
+        quantization = "none"
+    refine = quantization != "none" and settings.VECTOR_RERANK_EXACT
+    return kind, quantization, refine
+
+
+def needs_migration(index: faiss.Index, corpus: Optional[int] = None) -> bool:
+    """Whether an index is in a corpus large enough for the configured ANN layout but not in it."""
+    if index.ntotal == 0:
+        return False
+    wanted = target_spec(index.ntotal, index.d, corpus)
+    return wanted != FLAT_SPEC and index_spec(index) != wanted
+
+
+def read_index(path: str, mmap: bool) -> Tuple[faiss.Index, bool]:
+    """Reads <path>/index.faiss, memory-mapped read-only when `mmap` is set.
+
+    Returns (index, mapped). IO_FLAG_MMAP_IFC maps the vector codes of every
+    layout (flat, SQ/PQ, HNSW storage, IVF lists) instead of copying them, so
+    they live in the page cache shared by every process mapping the same
+    file. Segments are immutable, so a mapped index is never written to.
+    """
+    index_file = os.path.join(path, "index.faiss")
+    index, mapped = None, False
+    if mmap:
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            mapped = True
+        except Exception as e:
+            logger.warning(f"Memory-mapped load of {index_file} failed, reading it instead: {e}")
+    if index is None:
+        index = faiss.read_index(index_file)
+    apply_search_params(index)
+    return index, mapped
+
+
+def load_store(path: str, embeddings, mmap: bool) -> Tuple[FAISS, bool]:
+    """Loads a store written by save_store (or FAISS.save_local)."""
+    index, mapped = read_index(path, mmap)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id), mapped
+
+
+def save_store(vector_db: FAISS, path: str):
+    """Same layout as FAISS.save_local, but every file is written under a temporary
+    name and renamed into place. Processes that still map the previous
+    index.faiss keep reading the old (unlinked) file instead of a half-written one."""
+    os.makedirs(path, exist_ok=True)
+    index_file = os.path.join(path, "index.faiss")
+    faiss.write_index(vector_db.index, f"{index_file}.tmp")
+    os.replace(f"{index_file}.tmp", index_file)
+
+    store_file = os.path.join(path, "index.pkl")
+    with open(f"{store_file}.tmp", "wb") as f:
+        pickle.dump((vector_db.docstore, vector_db.index_to_docstore_id), f)
+    os.replace(f"{store_file}.tmp", store_file)
@@ -9,15 +9,14 @@ from loguru import logger
 def inspect_faiss_index():
     """Inspect the FAISS index to see what documents are stored."""
     
-    if not faiss_service.vector_db:
+    if not faiss_service.segments:
         print("❌ No FAISS index found!")
         return
     
-    # Get all documents from the docstore
-    docstore = faiss_service.vector_db.docstore
-    all_docs = list(docstore._dict.values())
+    # Get all live documents from every segment
+    all_docs = [doc for _, doc in faiss_service.iter_documents()]
     
-    print(f"\n📊 Total documents in index: {len(all_docs)}")
+    print(f"\n📊 Total documents in index: {len(all_docs)} ({len(faiss_service.segments)} segments)")
     print("=" * 80)
     
     # Group by filename
@@ -6,32 +6,41 @@ sys.path.append(os.getcwd())
 
 from app.services.faiss_service import faiss_service
 from app.core.config import settings
+from app.services.vector_index import save_store
 from loguru import logger
 
 def patch_index_metadata():
-    if faiss_service.vector_db is None:
+    if not faiss_service.segments:
         print("Vector DB is not loaded.")
         return
 
     print("Patching FAISS index metadata with image URLs...")
     count = 0
-    for doc_id, doc in faiss_service.vector_db.docstore._dict.items():
-        file_name = doc.metadata.get("file_name")
-        page = doc.metadata.get("page")
-        
-        # document_processor uses 0-indexed pages for images
-        if file_name and page is not None:
-            image_filename = f"{file_name}_{page}.jpg"
-            image_path = os.path.join("static", "extracted_images", image_filename)
+    patched_segments = []
+    for segment in faiss_service.segments:
+        segment_count = 0
+        for doc_id, doc in segment.store.docstore._dict.items():
+            file_name = doc.metadata.get("file_name")
+            page = doc.metadata.get("page")
             
-            if os.path.exists(image_path):
-                doc.metadata["image_url"] = f"/static/extracted_images/{image_filename}"
-                count += 1
+            # document_processor uses 0-indexed pages for images
+            if file_name and page is not None:
+                image_filename = f"{file_name}_{page}.jpg"
+                image_path = os.path.join("static", "extracted_images", image_filename)
+                
+                if os.path.exists(image_path):
+                    doc.metadata["image_url"] = f"/static/extracted_images/{image_filename}"
+                    segment_count += 1
+        if segment_count:
+            patched_segments.append(segment)
+            count += segment_count
     
     if count > 0:
         print(f"Patched {count} documents with image_url.")
         print("Saving index...")
-        faiss_service.vector_db.save_local(faiss_service.index_path)
+        # Offline maintenance: segments are otherwise never rewritten in place
+        for segment in patched_segments:
+            save_store(segment.store, segment.path)
         print("Index saved successfully.")
     else:
         print("No documents were patched. Please check if images exist in static/extracted_images.")
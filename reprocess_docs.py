@@ -22,9 +22,12 @@ def reprocess_all():
     # Force TEXT_ONLY_MODE to False for this session
     settings.TEXT_ONLY_MODE = False
     
-    # Process and re-index
-    # Note: This will add new chunks. Ideally we should clear the index first or update metadata.
-    # For now, we'll just process them to ensure images are generated in static/extracted_images.
+    # Drop the old chunks first; otherwise ingest deduplication would skip
+    # every re-processed chunk as a copy of the one already indexed
+    for path in files:
+        faiss_service.delete_documents_by_file(os.path.basename(path))
+
+    # Process and re-index (unchanged text is served from the embedding cache)
     chunks = document_processor.process_documents(files)
     
     if chunks:
@@ -24,35 +24,32 @@ settings.TEXT_ONLY_MODE = False
 try:
     from app.services.faiss_service import faiss_service
     
-    if faiss_service.vector_db is None:
+    if not faiss_service.segments:
         print("Vector DB failed to load via service. Trying direct pickle manipulation...")
         raise Exception("Service load failed")
 
-    print(f"Service loaded index. Patching {len(faiss_service.vector_db.docstore._dict)} docs...")
+    print(f"Service loaded index. Patching {faiss_service.num_chunks} docs...")
     count = 0
-    for doc_id, doc in faiss_service.vector_db.docstore._dict.items():
-        file_name = doc.metadata.get("file_name")
-        page = doc.metadata.get("page")
-        if file_name and page is not None:
-            image_filename = f"{file_name}_{page}.jpg"
-            image_path = os.path.join("static", "extracted_images", image_filename)
-            if os.path.exists(image_path):
-                doc.metadata["image_url"] = f"/static/extracted_images/{image_filename}"
-                count += 1
+    for segment in faiss_service.segments:
+        segment_count = 0
+        for doc_id, doc in segment.store.docstore._dict.items():
+            file_name = doc.metadata.get("file_name")
+            page = doc.metadata.get("page")
+            if file_name and page is not None:
+                image_filename = f"{file_name}_{page}.jpg"
+                image_path = os.path.join("static", "extracted_images", image_filename)
+                if os.path.exists(image_path):
+                    doc.metadata["image_url"] = f"/static/extracted_images/{image_filename}"
+                    segment_count += 1
+        if segment_count:
+            # faiss may be mocked, so only the docstore pickle is rewritten
+            import pickle
+            pkl_path = os.path.join(segment.path, "index.pkl")
+            with open(pkl_path, "wb") as f:
+                pickle.dump((segment.store.docstore, segment.store.index_to_docstore_id), f)
+            count += segment_count
     
     if count > 0:
-        # We need to save it. save_local might call faiss.write_index which is mocked.
-        # So we use pickle directly.
-        pkl_path = os.path.join(settings.INDEX_PATH, "index.pkl")
-        with open(pkl_path, "wb") as f:
-            # We assume it's (index, docstore, index_to_docstore_id)
-            pickle_data = (
-                faiss_service.vector_db.index, 
-                faiss_service.vector_db.docstore, 
-                faiss_service.vector_db.index_to_docstore_id
-            )
-            import pickle
-            pickle.dump(pickle_data, f)
         print(f"Successfully patched {count} docs.")
     else:
         print("No matches found.")
@@ -0,0 +1,104 @@
+"""
+Benchmark: ingest embedding throughput of the embedding backends.
+
+Embeds the same corpus with sentence-transformers on PyTorch (the library's
+default batch size and the configured EMBEDDING_BATCH_SIZE) and with the
+ONNX Runtime export in float32 and int8, and reports chunks/sec plus the
+cosine similarity of each backend's vectors to the PyTorch ones.
+
+The corpus is the chunk text of the live index when it has one, otherwise
+the plain-text files passed with --files, otherwise synthetic sentences of
+mixed length (to exercise length bucketing).
+
+Usage: python scripts/bench_embeddings.py [--chunks 2000] [--files a.txt b.md] [--threads 4]
+"""
+import argparse
+import os
+import pickle
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.core.config import settings
+from app.services.embedding_engine import OnnxEmbeddings, export_onnx, onnx_model_dir
+from app.services.segments import SEGMENTS_DIR, read_manifest
+
+
+def load_corpus(files, chunks: int):
+    manifest = read_manifest(settings.INDEX_PATH)
+    if manifest and manifest["segments"] and not files:
+        texts = []
+        for name in manifest["segments"]:
+            with open(os.path.join(settings.INDEX_PATH, SEGMENTS_DIR, name, "index.pkl"), "rb") as f:
+                docstore, _ = pickle.load(f)
+            texts.extend(doc.page_content for doc in docstore._dict.values())
+        if texts:
+            print(f"Using {min(len(texts), chunks)} chunks from the live index")
+            return texts[:chunks]
+    if files:
+        texts = []
+        for path in files:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+            texts.extend(text[i:i + 1000] for i in range(0, len(text), 800))
+        print(f"Using {min(len(texts), chunks)} chunks from {len(files)} files")
+        return texts[:chunks]
+
+    rng = random.Random(0)
+    words = "the index stores chunks of every uploaded document and answers questions about them quickly".split()
+    print(f"Using {chunks} synthetic chunks")
+    return [" ".join(rng.choices(words, k=rng.randint(8, 220))) for _ in range(chunks)]
+
+
+def timed(embed, texts):
+    start = time.perf_counter()
+    vectors = np.asarray(embed(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--files", nargs="*", default=[])
+    parser.add_argument("--batch-size", type=int, default=settings.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_THREADS)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.files, args.chunks)
+
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    backends = [
+        ("torch (default batch)", HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL).embed_documents),
+        (f"torch (batch {args.batch_size})", HuggingFaceEmbeddings(
+            model_name=settings.EMBEDDING_MODEL, encode_kwargs={"batch_size": args.batch_size}).embed_documents),
+    ]
+    model_dir = onnx_model_dir(settings.EMBEDDING_MODEL)
+    export_onnx(settings.EMBEDDING_MODEL, model_dir, quantize=True)
+    for quantized in (False, True):
+        engine = OnnxEmbeddings(model_dir, args.batch_size, args.threads, quantized)
+        backends.append((f"onnx {'int8' if quantized else 'float32'} (batch {args.batch_size})", engine.embed_documents))
+
+    reference = None
+    print(f"{'backend':<32}{'chunks/s':>10}{'speedup':>10}{'min cos':>10}{'mean cos':>10}")
+    for label, embed in backends:
+        embed(texts[:16])  # warm-up
+        vectors, seconds = timed(embed, texts)
+        if reference is None:
+            reference, base_rate = vectors, len(texts) / seconds
+        cosine = np.sum(vectors * reference, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1))
+        rate = len(texts) / seconds
+        print(f"{label:<32}{rate:>10.1f}{rate / base_rate:>10.2f}{cosine.min():>10.4f}{cosine.mean():>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark: langchain EnsembleRetriever fusion vs the NumPy fusion engine.
+
+Part 1 fuses synthetic candidate lists (no model needed) so only the fusion
+stage is measured. Part 2 runs both full hybrid paths against the live index
+when one exists.
+
+Usage: python scripts/bench_fusion.py [--candidates 50] [--rounds 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from langchain_core.documents import Document
+from langchain.retrievers import EnsembleRetriever
+from app.services.fusion import weighted_rrf
+
+
+def _timeit(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench_fusion_only(candidates: int, rounds: int):
+    corpus = [
+        Document(page_content=f"chunk {i} " + "lorem ipsum " * 100, metadata={"chunk_id": f"id-{i}"})
+        for i in range(candidates * 4)
+    ]
+    semantic = random.sample(corpus, candidates)
+    keyword = random.sample(corpus, candidates)
+    semantic_ids = np.array([d.metadata["chunk_id"] for d in semantic])
+    keyword_ids = np.array([d.metadata["chunk_id"] for d in keyword])
+
+    ensemble = EnsembleRetriever(retrievers=[], weights=[0.8, 0.2])
+    legacy_us = _timeit(lambda: ensemble.weighted_reciprocal_rank([semantic, keyword]), rounds)
+    numpy_us = _timeit(lambda: weighted_rrf([semantic_ids, keyword_ids], [0.8, 0.2], k=25), rounds)
+
+    print(f"Fusion only ({candidates}+{candidates} candidates, {rounds} rounds)")
+    print(f"  EnsembleRetriever.weighted_reciprocal_rank: {legacy_us:8.1f} us/query")
+    print(f"  fusion.weighted_rrf:                        {numpy_us:8.1f} us/query")
+
+
+def bench_end_to_end(rounds: int):
+    from langchain_community.retrievers import BM25Retriever
+    from langchain_community.vectorstores import FAISS
+    from app.services.faiss_service import faiss_service
+
+    if not faiss_service.segments:
+        print("No FAISS index found; skipping end-to-end benchmark.")
+        return
+
+    queries = ["experience with python", "candlestick pattern", "education and skills", "project summary"]
+    docs = [doc for _, doc in faiss_service.iter_documents()]
+    bm25 = BM25Retriever.from_documents(docs)
+    bm25.k = 50
+    # The legacy path searched one flat store over the whole corpus
+    vector_db = FAISS.from_documents(docs, faiss_service.embeddings)
+    ensemble = EnsembleRetriever(
+        retrievers=[vector_db.as_retriever(search_kwargs={"k": 50}), bm25],
+        weights=[0.8, 0.2],
+    )
+    searcher = faiss_service.get_hybrid_retriever()
+
+    rounds = max(1, rounds // 100)
+    legacy_ms = _timeit(lambda: [ensemble.invoke(q)[:25] for q in queries], rounds) / 1000 / len(queries)
+    numpy_ms = _timeit(lambda: [searcher.search(q, 25) for q in queries], rounds) / 1000 / len(queries)
+
+    print(f"End to end ({len(docs)} chunks, k=25)")
+    print(f"  EnsembleRetriever: {legacy_ms:8.2f} ms/query")
+    print(f"  HybridSearcher:    {numpy_ms:8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--skip-index", action="store_true", help="Only run the synthetic fusion benchmark")
+    args = parser.parse_args()
+
+    bench_fusion_only(args.candidates, args.rounds)
+    if not args.skip_index:
+        bench_end_to_end(args.rounds)
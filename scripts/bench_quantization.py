@@ -0,0 +1,135 @@
+"""
+Benchmark: memory per million chunks and recall of the vector storage options.
+
+Uses the vectors of the live index segments when they exist (read back with
+reconstruct_n, nothing is re-embedded), otherwise a synthetic set of unit
+vectors with the all-MiniLM-L6-v2 dimension. Recall@k is measured against
+exact flat search on the same vectors.
+
+Every layout is measured as one index and split into segments the way the
+live index is (its segment count, or SEGMENT_MAX_COUNT for synthetic data),
+each segment searched for its own top k and the results merged by distance.
+Segments too small to train PQ codebooks are stored float32, as in the index.
+
+Usage: python scripts/bench_quantization.py [--synthetic 50000] [--queries 200] [--k 10] [--segments 8]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Tuple
+
+import faiss
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.core.config import settings
+from app.services.segments import SEGMENTS_DIR, read_manifest
+from app.services.vector_index import build_index
+
+LAYOUTS = [
+    ("flat", "none", False),
+    ("flat", "fp16", False),
+    ("flat", "sq8", False),
+    ("flat", "pq", False),
+    ("flat", "pq", True),
+    ("hnsw", "none", False),
+    ("hnsw", "sq8", False),
+    ("ivf", "sq8", False),
+    ("ivf", "pq", False),
+    ("ivf", "pq", True),
+]
+
+
+def load_vectors(synthetic: int) -> Tuple[np.ndarray, int]:
+    """The vectors to benchmark and the number of segments they are spread over."""
+    manifest = read_manifest(settings.INDEX_PATH)
+    if manifest and manifest["segments"] and not synthetic:
+        from app.services.vector_index import extract_vectors
+        root = os.path.join(settings.INDEX_PATH, SEGMENTS_DIR)
+        vectors = np.concatenate([
+            extract_vectors(faiss.read_index(os.path.join(root, name, "index.faiss")))
+            for name in manifest["segments"]
+        ])
+        if len(vectors) >= 1000:
+            print(f"Using {len(vectors)} vectors from {len(manifest['segments'])} segments in {settings.INDEX_PATH}")
+            return vectors, len(manifest["segments"])
+        print(f"Only {len(vectors)} vectors in the live index; falling back to synthetic data.")
+    n = synthetic or 50000
+    rng = np.random.default_rng(0)
+    # Clustered data behaves more like sentence embeddings than uniform noise
+    centers = rng.normal(size=(64, 384)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, n)] + 0.5 * rng.normal(size=(n, 384)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    print(f"Using {n} synthetic vectors (d=384)")
+    return vectors, settings.SEGMENT_MAX_COUNT
+
+
+def segment_spec(spec, size: int):
+    """The layout a segment of `size` vectors gets for `spec` (see target_spec)."""
+    if spec[1] == "pq" and size < 2 ** settings.PQ_NBITS:
+        return spec[0], "none", False
+    return spec
+
+
+def build_segments(spec, vectors: np.ndarray, count: int) -> List[faiss.Index]:
+    dim = vectors.shape[1]
+    return [build_index(segment_spec(spec, len(part)), part, dim) for part in np.array_split(vectors, count) if len(part)]
+
+
+def search_segments(indexes: List[faiss.Index], queries: np.ndarray, k: int) -> np.ndarray:
+    """Top-k positions (into the concatenated vectors) over all segments, merged by distance."""
+    distances, positions, offset = [], [], 0
+    for index in indexes:
+        found_distances, found = index.search(queries, k)
+        distances.append(np.where(found >= 0, found_distances, np.inf))
+        positions.append(np.where(found >= 0, found + offset, -1))
+        offset += index.ntotal
+    distances, positions = np.hstack(distances), np.hstack(positions)
+    best = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(positions, best, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=0, help="Force N synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--segments", type=int, default=0, help="Segments to split the vectors into")
+    args = parser.parse_args()
+
+    vectors, segments = load_vectors(args.synthetic)
+    segments = args.segments or segments
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(n, size=min(args.queries, n), replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{'layout':<28}{'segments':>9}{'MB / 1M chunks':>16}{'recall@' + str(args.k):>12}{'ms / query':>12}{'build s':>10}")
+    for spec in LAYOUTS:
+        if spec[1] == "pq" and dim % settings.PQ_M:
+            continue
+        label = "+".join(part for part in (spec[0], spec[1], "rerank" if spec[2] else "") if part)
+        for count in sorted({1, segments}):
+            start = time.perf_counter()
+            indexes = build_segments(spec, vectors, count)
+            build_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = search_segments(indexes, queries, args.k)
+            query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            size = sum(faiss.serialize_index(index).nbytes for index in indexes)
+            mb_per_million = size / n * 1e6 / 2 ** 20
+            print(f"{label:<28}{len(indexes):>9}{mb_per_million:>16.0f}{recall:>12.3f}{query_ms:>12.3f}{build_s:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: retrieval throughput and latency with and without query micro-batching.
+
+Fires N concurrent searches (+ reranks) at the live index, once with each
+query submitted to the stage executors on its own and once through the
+QueryScheduler, and reports queries/sec and p50 / p95 latency. Run it at
+low and high concurrency to see both the throughput gain and the cost of
+the batching window.
+
+Usage: python scripts/bench_query_batching.py [--concurrency 1 8 50] [--rounds 3] [--k 25]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.services.executors import rerank_executor, search_executor
+from app.services.faiss_service import faiss_service
+from app.services.query_scheduler import query_scheduler
+from app.services.reranker import reranker
+
+
+async def unbatched(query: str, k: int):
+    docs = await search_executor.run(faiss_service.similarity_search, query, k=k)
+    return await rerank_executor.run(reranker.rerank, query, docs, top_n=5)
+
+
+async def batched(query: str, k: int):
+    docs = await query_scheduler.search(query, k)
+    return await query_scheduler.rerank(query, docs, 5)
+
+
+async def measure(run, queries, k: int):
+    latencies = []
+
+    async def one(query):
+        start = time.perf_counter()
+        await run(query, k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return len(queries) / (time.perf_counter() - start), np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 50])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    if not faiss_service.num_chunks:
+        print("The index is empty; upload some documents first.")
+        return
+    # Distinct texts, so the query embedding cache does not hide the model cost
+    rng = random.Random(0)
+    words = [doc.page_content.split()[0] for _, doc in faiss_service.iter_documents() if doc.page_content.split()]
+    make = lambda n: [" ".join(rng.choices(words, k=6)) + f" {rng.random():.6f}" for _ in range(n)]
+
+    print(f"{'users':>6}{'mode':>10}{'q/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for users in args.concurrency:
+        for label, run in (("direct", unbatched), ("batched", batched)):
+            results = [await measure(run, make(users), args.k) for _ in range(args.rounds)]
+            qps, p50, p95 = np.median(np.array(results), axis=0)
+            print(f"{users:>6}{label:>10}{qps:>10.1f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark: single-query vector search latency, one index vs parallel shard fan-out.
+
+Splits a synthetic corpus into equally sized flat shards (as compaction does,
+one per fan-out thread) and times one query at a time, searched shard by
+shard and fanned out over a thread pool, with the per-shard top-k merged the
+same way HybridSearcher does.
+
+Usage: python scripts/bench_shards.py [--chunks 400000] [--shards 1 2 4 8] [--queries 50] [--k 50]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.services.fusion import _top_k
+
+
+def search(shards, offsets, query, k, executor=None):
+    def one(args):
+        index, offset = args
+        distances, positions = index.search(query, k)
+        return positions[0] + offset, -distances[0].astype(np.float64)
+
+    parts = list(executor.map(one, zip(shards, offsets))) if executor else [one(a) for a in zip(shards, offsets)]
+    return _top_k(np.concatenate([p for p, _ in parts]), np.concatenate([s for _, s in parts]), k)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=400000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.chunks, 384)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    queries = vectors[rng.choice(args.chunks, size=args.queries, replace=False)]
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+    print(f"{args.chunks} chunks, d=384, k={args.k}, {os.cpu_count()} cores")
+    print(f"{'shards':>8}{'serial ms':>12}{'fan-out ms':>12}")
+    for count in args.shards:
+        bounds = np.linspace(0, args.chunks, count + 1).astype(int)
+        shards = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            index = faiss.IndexFlatL2(384)
+            index.add(vectors[lo:hi])
+            shards.append(index)
+        offsets = bounds[:-1]
+
+        timings = []
+        for pool in (None, executor):
+            start = time.perf_counter()
+            for query in queries:
+                search(shards, offsets, query[None, :], args.k, pool)
+            timings.append((time.perf_counter() - start) / len(queries) * 1000)
+        print(f"{count:>8}{timings[0]:>12.2f}{timings[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Offline check: does the rerank cascade pick the same top_n as reranking every candidate?
+
+For each query, the fused candidates are reranked twice: in full (rerank_many)
+and through rerank_cascade_many. Reports overlap@n, top-1 agreement, the mean
+number of candidates the cascade actually reranked, and the reranker time of
+both. Tune RERANK_CASCADE_MARGIN / RERANK_CASCADE_STEP until the agreement is
+acceptable for your corpus.
+
+Usage: python scripts/eval_rerank_cascade.py [--queries queries.txt] [--n 100] [--k 50] [--top-n 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app.services.faiss_service import faiss_service
+from app.services.metrics import get_metrics
+from app.services.reranker import reranker
+
+
+def sample_queries(n: int):
+    """Opening words of random chunks, as stand-ins for real questions."""
+    rng = random.Random(0)
+    texts = [doc.page_content for _, doc in faiss_service.iter_documents() if doc.page_content.strip()]
+    return [" ".join(text.split()[:12]) for text in rng.sample(texts, min(n, len(texts)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", help="text file with one query per line (default: sampled from the index)")
+    parser.add_argument("--n", type=int, default=100)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=5)
+    args = parser.parse_args()
+
+    if not faiss_service.num_chunks:
+        print("The index is empty; upload some documents first.")
+        return
+    if not reranker.ranker:
+        print("The reranker model is not available.")
+        return
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()][:args.n]
+    else:
+        queries = sample_queries(args.n)
+
+    hits = faiss_service.similarity_search_many(queries, k=args.k, with_scores=True)
+    keep = [i for i, h in enumerate(hits) if h]
+    queries, hits = [queries[i] for i in keep], [hits[i] for i in keep]
+
+    start = time.perf_counter()
+    full = reranker.rerank_many(queries, [[doc for doc, _ in h] for h in hits], top_n=args.top_n)
+    full_time = time.perf_counter() - start
+    start = time.perf_counter()
+    cascaded = reranker.rerank_cascade_many(queries, hits, top_n=args.top_n)
+    cascade_time = time.perf_counter() - start
+
+    key = lambda doc: (doc.metadata.get("file_name"), doc.metadata.get("chunk_id"), doc.page_content)
+    overlap = [
+        len({key(d) for d in a} & {key(d) for d in b}) / max(1, min(len(a), args.top_n))
+        for a, b in zip(full, cascaded)
+    ]
+    top1 = [bool(a) and bool(b) and key(a[0]) == key(b[0]) for a, b in zip(full, cascaded)]
+    metrics = get_metrics()
+
+    print(f"queries:            {len(queries)} (k={args.k}, top_n={args.top_n})")
+    print(f"overlap@{args.top_n}:          {np.mean(overlap):.3f}")
+    print(f"top-1 agreement:    {np.mean(top1):.3f}")
+    print(f"mean rerank depth:  {metrics['avg_rerank_depth'] or 0:.1f} of {metrics['avg_rerank_candidates'] or 0:.1f}")
+    print(f"full rerank:        {full_time * 1000:.0f} ms")
+    print(f"cascade:            {cascade_time * 1000:.0f} ms ({full_time / max(cascade_time, 1e-9):.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
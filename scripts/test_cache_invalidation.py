@@ -0,0 +1,93 @@
+"""
+Cache invalidation on an index generation bump: once another worker commits
+to the index, retrieval and answer cache entries from the previous
+generation must no longer be served, without waiting for the periodic
+manifest check.
+
+Runs against a throwaway index in a temporary directory.
+Usage: python scripts/test_cache_invalidation.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="cache_invalidation_")
+os.environ["INDEX_PATH"] = os.path.join(WORK_DIR, "faiss_index")
+# Far longer than the test: only the synchronous check can see the other worker's commit
+os.environ["INDEX_RELOAD_INTERVAL"] = "3600"
+# The test builds its own in-process answer cache
+os.environ["ANSWER_CACHE"] = "false"
+
+from langchain_core.documents import Document
+from app.services.answer_cache import SemanticAnswerCache, conversation_key
+from app.services.faiss_service import FAISSService, faiss_service
+from app.services.retrieval_cache import RetrievalCache
+
+QUERY = "What is the refund policy?"
+
+
+def upload(service, file_name, text):
+    service.add_documents([Document(page_content=text, metadata={"file_name": file_name, "chunk_id": f"{file_name}-0"})])
+
+
+def check(label, condition, detail):
+    print(f"SUCCESS: {label}." if condition else f"FAILURE: {label}: {detail}")
+    return condition
+
+
+def test_cache_invalidation():
+    print("Starting cache invalidation test...")
+    ok = True
+    upload(faiss_service, "policy.txt", "Refunds are accepted within thirty days.")
+    other_worker = FAISSService()
+
+    retrieval_cache = RetrievalCache(capacity=100, ttl=600)
+    answer_cache = SemanticAnswerCache(
+        faiss_service.embeddings, faiss_service.embedding_model_key, threshold=0.95, max_entries=100, ttl=600
+    )
+    conversation = conversation_key("general", [])
+    generation = faiss_service.latest_generation()
+    retrieval_cache.put(QUERY, (False, False, False), generation, ["policy.txt-0"])
+    answer_cache.store(QUERY, conversation, generation, "Within thirty days.", [])
+    ok &= check("entries served within a generation",
+                retrieval_cache.get(QUERY, (False, False, False), generation) == ["policy.txt-0"]
+                and answer_cache.lookup(QUERY, conversation, generation) is not None,
+                f"generation {generation}")
+
+    # 1. Another worker commits; the next read must see its generation
+    upload(other_worker, "policy_v2.txt", "Refunds are now accepted within sixty days.")
+    latest = faiss_service.latest_generation()
+    ok &= check("commit of another worker seen synchronously",
+                latest == other_worker.generation and latest > generation,
+                f"read {latest}, other worker is at {other_worker.generation}")
+    ok &= check("retrieval cache invalidated", retrieval_cache.get(QUERY, (False, False, False), latest) is None,
+                "served a result of the previous generation")
+    ok &= check("answer cache invalidated", answer_cache.lookup(QUERY, conversation, latest) is None,
+                "served an answer of the previous generation")
+
+    # 2. A result computed on the old generation must not be stored for the new one
+    retrieval_cache.put(QUERY, (False, False, False), generation, ["policy.txt-0"])
+    ok &= check("late results of the old generation dropped",
+                retrieval_cache.get(QUERY, (False, False, False), latest) is None,
+                "stored a result computed before the bump")
+
+    # 3. Cached chunk ids resolve even when the docstore id differs (re-added after a delete)
+    faiss_service.delete_documents_by_file("policy.txt")
+    upload(faiss_service, "policy.txt", "Refunds are accepted within ninety days.")
+    chunk = faiss_service.get_chunk("policy.txt-0")
+    ok &= check("chunks found by chunk_id", chunk is not None and "ninety" in chunk.page_content,
+                f"found {chunk}")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = test_cache_invalidation()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    raise SystemExit(0 if passed else 1)
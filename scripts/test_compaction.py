@@ -0,0 +1,168 @@
+"""
+Deletes and compaction against a rebuild: after tombstoning files and
+compacting the segments, the index must hold the same chunks, file map,
+search results and BM25 scores as an index built from scratch from the
+surviving chunks. Checked for the float32 layout and for SQ8, where
+compaction must take vectors from the embedding cache rather than
+re-encoding decoded ones. Also checks that the vector layout follows the
+size of the whole corpus rather than of each segment, and that compaction
+leaves one shard per search fan-out thread.
+
+Runs against throwaway indexes in a temporary directory.
+Usage: python scripts/test_compaction.py
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="compaction_")
+os.environ["INDEX_PATH"] = os.path.join(WORK_DIR, "faiss_index")
+os.environ["DEDUP_ENABLED"] = "false"
+# Compaction only runs when the test asks for it
+os.environ["SEGMENT_MAX_COUNT"] = "1000"
+os.environ["SEGMENT_TOMBSTONE_RATIO"] = "1.0"
+os.environ["SEARCH_FANOUT_THREADS"] = "4"
+
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.services.faiss_service import FAISSService, faiss_service
+from app.services.vector_index import FLAT_SPEC, index_spec
+
+TOPICS = ("invoice refund policy contract salary python rust kubernetes resume candidate "
+          "deadline budget audit vendor travel expense laptop security training holiday").split()
+# Distinct texts, so search results have no ties whose order depends on the segment layout
+WORDS = [f"{topic}{n}" for topic in TOPICS for n in range(10)]
+QUERIES = ["refund3 policy7 deadline1", "python2 resume5 candidate0", "travel4 expense4 audit9", "security1 training8"]
+
+
+def make_files(count, chunks_per_file):
+    rng = random.Random(0)
+    return {
+        f"file_{i}.txt": [
+            Document(
+                page_content=" ".join(rng.choice(WORDS) for _ in range(12)),
+                metadata={"file_name": f"file_{i}.txt", "chunk_id": f"file_{i}-{j}"},
+            )
+            for j in range(chunks_per_file)
+        ]
+        for i in range(count)
+    }
+
+
+def compact_fully(service):
+    while service.compact():
+        pass
+    if service._compactor is not None:
+        service._compactor.join()
+
+
+def fingerprint(service):
+    snapshot = service.snapshot
+    keyword = snapshot.keyword_index
+    return {
+        "chunks": sorted(doc_id for doc_id, _ in service.iter_documents()),
+        "files": {name: sorted(ids) for name, ids in snapshot.file_index.items()},
+        "search": [[doc.metadata["chunk_id"] for doc in service.similarity_search(q, k=5)] for q in QUERIES],
+        "bm25": [sorted((doc_id, round(score, 6)) for doc_id, score in keyword.search(q, k=100000)) for q in QUERIES],
+    }
+
+
+def rebuild(service, name):
+    """An index built in one go from the chunks that survive in `service`."""
+    settings.INDEX_PATH = os.path.join(WORK_DIR, name)
+    fresh = FAISSService()
+    fresh.add_documents([doc for _, doc in service.iter_documents()])
+    compact_fully(fresh)
+    return fresh
+
+
+def compare(label, actual, expected, keys=("chunks", "files", "search", "bm25")):
+    mismatched = [key for key in keys if actual[key] != expected[key]]
+    if mismatched:
+        print(f"FAILURE: {label}: {', '.join(mismatched)} differ from the rebuilt index.")
+        return False
+    print(f"SUCCESS: {label}: index matches the rebuilt index.")
+    return True
+
+
+def test_compaction():
+    print("Starting compaction test...")
+    ok = True
+    for chunks in make_files(8, 20).values():
+        faiss_service.add_documents(chunks)
+
+    # 1. Float32 segments: tombstones, then merge everything into one segment
+    for name in ("file_1.txt", "file_4.txt"):
+        faiss_service.delete_documents_by_file(name)
+    tombstoned = fingerprint(faiss_service)
+    rebuilt = fingerprint(rebuild(faiss_service, "rebuild_flat"))
+    # Fused ranks break score ties by segment order, so only the scores themselves are compared here
+    ok &= compare("tombstones", tombstoned, rebuilt, ("chunks", "files", "bm25"))
+
+    settings.SEGMENT_MAX_COUNT = 1
+    compact_fully(faiss_service)
+    snapshot = faiss_service.snapshot
+    if len(snapshot.segments) != 1 or snapshot.tombstones:
+        print(f"FAILURE: Expected one segment without tombstones, got {len(snapshot.segments)} and {len(snapshot.tombstones)}.")
+        ok = False
+    ok &= compare("float32 compaction", fingerprint(faiss_service), rebuilt)
+
+    # 2. SQ8: migrate, delete, compact again; vectors must come from the cache both times
+    settings.VECTOR_INDEX_MIGRATE_AT = 10
+    settings.VECTOR_QUANTIZATION = "sq8"
+    settings.VECTOR_RERANK_EXACT = False
+    compact_fully(faiss_service)
+    faiss_service.delete_documents_by_file("file_6.txt")
+    settings.SEGMENT_TOMBSTONE_RATIO = 0.0
+    compact_fully(faiss_service)
+    settings.SEGMENT_TOMBSTONE_RATIO = 1.0
+    ok &= compare("sq8 compaction", fingerprint(faiss_service), fingerprint(rebuild(faiss_service, "rebuild_sq8")))
+
+    # 3. The layout follows the corpus size: segments far below the threshold migrate once the corpus reaches it
+    settings.SEGMENT_MAX_COUNT = 1000
+    settings.VECTOR_INDEX_TYPE = "hnsw"
+    settings.VECTOR_QUANTIZATION = "none"
+    settings.VECTOR_INDEX_MIGRATE_AT = faiss_service.num_chunks + 40
+    new_files = make_files(10, 20)
+    faiss_service.add_documents(new_files["file_8.txt"])
+    first = index_spec(faiss_service.segments[-1].store.index)
+    faiss_service.add_documents(new_files["file_9.txt"])
+    compact_fully(faiss_service)
+    specs = {index_spec(segment.store.index) for segment in faiss_service.segments}
+    if first != FLAT_SPEC or len(faiss_service.segments) < 2 or specs != {("hnsw", "none", False)}:
+        print(f"FAILURE: Expected every segment to move from flat to HNSW, got {first} then {specs}.")
+        ok = False
+    else:
+        print(f"SUCCESS: {len(faiss_service.segments)} segments migrated to HNSW once the corpus reached the threshold.")
+
+    # 4. Compaction keeps one shard per fan-out thread instead of merging everything
+    settings.INDEX_PATH = os.path.join(WORK_DIR, "shards")
+    settings.VECTOR_INDEX_TYPE = "flat"
+    settings.SEGMENT_SHARD_MIN_CHUNKS = 10
+    sharded = FAISSService()
+    for chunks in make_files(16, 20).values():
+        sharded.add_documents(chunks)
+    settings.SEGMENT_MAX_COUNT = 1
+    compact_fully(sharded)
+    sizes = sorted(len(segment) for segment in sharded.segments)
+    if sizes != [80] * 4:
+        print(f"FAILURE: Expected 4 shards of 80 chunks for 4 fan-out threads, got {sizes}.")
+        ok = False
+    else:
+        print("SUCCESS: 320 chunks compacted into one shard per fan-out thread.")
+
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = test_compaction()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    raise SystemExit(0 if passed else 1)
@@ -0,0 +1,102 @@
+"""
+Deleting files that share deduplicated chunks: a file whose chunks were all
+dropped as duplicates must still be listed, scoped and deletable, and
+deleting the file that holds the shared chunks must re-index them for the
+files that remain. Near-duplicates (the same template with a different
+name) must be kept.
+
+Runs against a throwaway index in a temporary directory.
+Usage: python scripts/test_dedup_delete.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="dedup_delete_")
+os.environ["INDEX_PATH"] = os.path.join(WORK_DIR, "faiss_index")
+os.environ["DEDUP_ENABLED"] = "true"
+
+from langchain_core.documents import Document
+from app.services.dedup import deduplicator
+from app.services.faiss_service import faiss_service
+from app.services.search_filter import SearchFilter
+
+SHARED = [
+    "The refund policy allows returns within thirty days of delivery.",
+    "Support is available on weekdays between nine and five.",
+]
+
+# Same template, different name: about 0.95 estimated Jaccard similarity
+RESUME = (
+    "{name}, backend engineer with eight years of Python, Kubernetes and Postgres. Led the migration of a payments "
+    "platform to event sourcing, mentored four engineers, and cut p99 latency of the checkout service by sixty percent. "
+    "Education: BSc Computer Science. Languages: English, German. Interests: climbing, open source, chess and cycling."
+)
+
+
+def upload(file_name, texts):
+    chunks = [
+        Document(page_content=text, metadata={"file_name": file_name, "chunk_id": f"{file_name}-{i}"})
+        for i, text in enumerate(texts)
+    ]
+    kept, dropped = deduplicator.filter(chunks)
+    faiss_service.add_documents(kept)
+    return len(kept), dropped
+
+
+def texts_of(file_name):
+    """Texts a search scoped to `file_name` can reach."""
+    hits = faiss_service.similarity_search("refund policy support", k=10, search_filter=SearchFilter(file_names=[file_name]))
+    return sorted(doc.page_content for doc in hits)
+
+
+def check(label, condition, detail):
+    print(f"SUCCESS: {label}." if condition else f"FAILURE: {label}: {detail}")
+    return condition
+
+
+def test_dedup_delete():
+    print("Starting dedup delete test...")
+    ok = True
+    upload("original.txt", SHARED + ["Only the original mentions the warehouse address."])
+    ok &= check("copies are deduplicated", [upload("copy_a.txt", SHARED), upload("copy_b.txt", SHARED)] == [(0, 2)] * 2,
+                f"{faiss_service.num_chunks} chunks indexed")
+    ok &= check("copies are listed", sorted(faiss_service.list_files()) == ["copy_a.txt", "copy_b.txt", "original.txt"],
+                faiss_service.list_files())
+    ok &= check("copies can be scoped", texts_of("copy_a.txt") == sorted(SHARED), texts_of("copy_a.txt"))
+
+    # 1. Deleting the owner re-indexes the shared chunks once, for the copies
+    faiss_service.delete_documents_by_file("original.txt")
+    ok &= check("owner deleted", "original.txt" not in faiss_service.list_files(), faiss_service.list_files())
+    ok &= check("shared chunks re-indexed once", faiss_service.num_chunks == len(SHARED), f"{faiss_service.num_chunks} chunks")
+    ok &= check("both copies still scoped",
+                texts_of("copy_a.txt") == sorted(SHARED) and texts_of("copy_b.txt") == sorted(SHARED),
+                [texts_of("copy_a.txt"), texts_of("copy_b.txt")])
+
+    # 2. A copy holding only references, then the last copy
+    for file_name in ("copy_a.txt", "copy_b.txt"):
+        faiss_service.delete_documents_by_file(file_name)
+        ok &= check(f"{file_name} deleted", file_name not in faiss_service.list_files(), faiss_service.list_files())
+    ok &= check("index empty", faiss_service.num_chunks == 0 and not deduplicator.files(),
+                f"{faiss_service.num_chunks} chunks, references from {deduplicator.files()}")
+
+    # 3. Near-duplicates keep their own chunk: the words that differ stay searchable
+    upload("resume_alice.txt", [RESUME.format(name="Alice Smith")])
+    ok &= check("near-duplicate kept", upload("resume_bob.txt", [RESUME.format(name="Bob Jones")]) == (1, 0),
+                f"{faiss_service.num_chunks} chunks indexed")
+    ok &= check("differing words searchable", texts_of("resume_bob.txt") == [RESUME.format(name="Bob Jones")],
+                texts_of("resume_bob.txt"))
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = test_dedup_delete()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    raise SystemExit(0 if passed else 1)
@@ -33,7 +33,7 @@ def test_deletion():
     faiss_service.add_documents(chunks)
     
     # Verify they were added
-    initial_count = len(faiss_service.vector_db.docstore._dict)
+    initial_count = faiss_service.num_chunks
     print(f"Initial doc count: {initial_count}")
     
     # 3. Delete documents by file
@@ -41,12 +41,12 @@ def test_deletion():
     faiss_service.delete_documents_by_file(test_filename)
     
     # 4. Verify deletion
-    final_count = len(faiss_service.vector_db.docstore._dict)
+    final_count = faiss_service.num_chunks
     print(f"Final doc count: {final_count}")
     
     # Check if test_filename exists in any metadata
     found = False
-    for doc in faiss_service.vector_db.docstore._dict.values():
+    for _, doc in faiss_service.iter_documents():
         if doc.metadata.get("file_name") == test_filename:
             found = True
             break
@@ -0,0 +1,103 @@
+"""
+Filtered search on every vector layout: a file-scoped query must return only
+that file's chunks whether the subset is scored directly or searched through
+the index with an id selector, including the flat PQ layout whose search does
+not take selectors.
+
+Runs against throwaway indexes in a temporary directory.
+Usage: python scripts/test_filtered_search.py
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="filtered_search_")
+os.environ["INDEX_PATH"] = os.path.join(WORK_DIR, "faiss_index")
+os.environ["DEDUP_ENABLED"] = "false"
+os.environ["VECTOR_INDEX_MIGRATE_AT"] = "100"
+
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.services.faiss_service import FAISSService
+from app.services.search_filter import SearchFilter
+from app.services.vector_index import index_spec
+
+# (index type, quantization, exact re-rank)
+LAYOUTS = [
+    ("flat", "none", False),
+    ("flat", "sq8", False),
+    ("flat", "pq", False),
+    ("flat", "pq", True),
+    ("hnsw", "none", False),
+    ("ivf", "pq", False),
+]
+WORDS = ("invoice refund policy contract salary python rust kubernetes resume candidate "
+         "deadline budget audit vendor travel expense laptop security training holiday").split()
+
+
+def make_chunks(files, per_file):
+    rng = random.Random(0)
+    return [
+        Document(
+            page_content=" ".join(rng.choice(WORDS) for _ in range(15)),
+            metadata={"file_name": f"file_{i}.txt", "chunk_id": f"file_{i}-{j}"},
+        )
+        for i in range(files) for j in range(per_file)
+    ]
+
+
+def build(layout, chunks):
+    kind, quantization, refine = layout
+    settings.INDEX_PATH = os.path.join(WORK_DIR, "-".join(map(str, layout)))
+    settings.VECTOR_INDEX_TYPE, settings.VECTOR_QUANTIZATION, settings.VECTOR_RERANK_EXACT = kind, quantization, refine
+    service = FAISSService()
+    service.add_documents(chunks)
+    while service.compact():
+        pass
+    return service
+
+
+def test_filtered_search():
+    print("Starting filtered search test...")
+    ok = True
+    chunks = make_chunks(10, 60)
+    search_filter = SearchFilter(file_names=["file_3.txt"])
+    for layout in LAYOUTS:
+        service = build(layout, chunks)
+        spec = index_spec(service.segments[0].store.index)
+        if spec != layout:
+            print(f"FAILURE: {layout}: the index was built as {spec}.")
+            ok = False
+            continue
+        searcher = service.snapshot.searcher()
+        # 0: every filtered query goes through the index; 10**6: every subset is scored directly
+        for exact_max in (0, 10 ** 6):
+            searcher.exact_filter_max = exact_max
+            label = f"{spec} (exact_filter_max={exact_max})"
+            try:
+                hits = searcher.search("refund policy deadline", 5, search_filter=search_filter)
+            except Exception as e:
+                print(f"FAILURE: {label}: {e}")
+                ok = False
+                continue
+            files = {doc.metadata["file_name"] for doc in hits}
+            if len(hits) != 5 or files != {"file_3.txt"}:
+                print(f"FAILURE: {label}: got {len(hits)} hits from {sorted(files)}.")
+                ok = False
+            else:
+                print(f"SUCCESS: {label}: 5 hits, all from file_3.txt.")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = test_filtered_search()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    raise SystemExit(0 if passed else 1)
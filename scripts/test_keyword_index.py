@@ -0,0 +1,85 @@
+"""
+BM25 scores of the incremental keyword index against a fresh one: segments
+with tombstones, in-memory additions, indexes built on top of a previous
+one (sharing its tombstones) and compacted segments must all score every
+chunk exactly like KeywordIndex.from_documents over the live chunks.
+
+Usage: python scripts/test_keyword_index.py
+"""
+import os
+import random
+import sys
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from langchain_core.documents import Document
+from app.services.keyword_index import KeywordIndex
+
+WORDS = ("invoice refund policy contract salary python rust kubernetes resume candidate "
+         "deadline budget audit vendor travel expense laptop security training holiday").split()
+QUERIES = ["refund policy", "python rust resume", "travel expense audit deadline", "holiday", "unknownterm"]
+
+
+def make_docs(prefix, count, rng):
+    return {
+        f"{prefix}-{i}": Document(page_content=" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))))
+        for i in range(count)
+    }
+
+
+def segment(docs):
+    return KeywordIndex.from_documents(list(docs), list(docs.values())).compact()
+
+
+def scores(index):
+    return [sorted((doc_id, round(score, 9)) for doc_id, score in index.search(q, k=100000)) for q in QUERIES]
+
+
+def compare(label, index, live):
+    expected = KeywordIndex.from_documents(list(live), list(live.values()))
+    if len(index) != len(expected) or scores(index) != scores(expected):
+        print(f"FAILURE: {label}: scores differ from a fresh index over the same {len(live)} chunks.")
+        return False
+    print(f"SUCCESS: {label}: scores match a fresh index.")
+    return True
+
+
+def test_keyword_index():
+    print("Starting keyword index test...")
+    rng = random.Random(0)
+    parts = [make_docs(f"seg{i}", 200, rng) for i in range(3)]
+    delta = make_docs("delta", 50, rng)
+    bases = [segment(part) for part in parts]
+    corpus = {doc_id: doc for part in parts + [delta] for doc_id, doc in part.items()}
+    ok = True
+
+    # 1. Two segments with tombstones plus chunks added in memory
+    first = KeywordIndex(bases=bases[:2])
+    removed = set(rng.sample(list(parts[0]) + list(parts[1]), 120))
+    first.remove(removed)
+    first.add_documents(list(delta), list(delta.values()))
+    first.remove(list(delta)[:10])
+    removed.update(list(delta)[:10])
+    live_first = {d: doc for d, doc in corpus.items() if d not in removed and not d.startswith("seg2")}
+    ok &= compare("tombstones and delta", first, live_first)
+
+    # 2. The next index shares the first one's tombstones; its removals must not leak back
+    second = KeywordIndex(bases=bases, previous=first)
+    more = set(rng.sample([d for d in corpus if d.startswith("seg") and d not in removed], 150))
+    second.remove(more)
+    live_second = {
+        d: doc for d, doc in corpus.items() if d.startswith("seg") and d not in removed and d not in more
+    }
+    ok &= compare("index built on a previous one", second, live_second)
+    ok &= compare("previous index after the next one changed", first, live_first)
+
+    # 3. Compaction keeps the live rows only
+    ok &= compare("compacted segment", KeywordIndex(bases=[second.compact()]), live_second)
+
+    return ok
+
+
+if __name__ == "__main__":
+    raise SystemExit(0 if test_keyword_index() else 1)
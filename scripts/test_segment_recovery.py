@@ -0,0 +1,89 @@
+"""
+Crash recovery of the segmented index: a segment published without its
+manifest commit (the process died in between) must not break later uploads,
+and is removed the next time the index is loaded.
+
+Runs against a throwaway index in a temporary directory.
+Usage: python scripts/test_segment_recovery.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Add project root to sys.path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="segment_recovery_")
+os.environ["INDEX_PATH"] = os.path.join(WORK_DIR, "faiss_index")
+
+from langchain_core.documents import Document
+from app.services.embedding_cache import embed_documents_cached, embedding_cache
+from app.services.faiss_service import FAISSService, faiss_service
+from app.services.segments import Segment, build_store, read_manifest, segment_name
+
+
+def make_chunks(file_name, texts):
+    return [
+        Document(page_content=text, metadata={"file_name": file_name, "chunk_id": f"{file_name}-{i}"})
+        for i, text in enumerate(texts)
+    ]
+
+
+def crash_after_publish(service, chunks):
+    """Does what _commit_adds does up to the manifest write, then stops."""
+    ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+    vectors = embed_documents_cached(
+        service.embeddings, service.embedding_model_key, [chunk.page_content for chunk in chunks], embedding_cache
+    )
+    staging_path = Segment.stage(service._segments_root, build_store(ids, chunks, vectors, service.embeddings))
+    name = segment_name(service.snapshot.next_segment)
+    Segment.publish(staging_path, name, service.embeddings, False)
+    return name
+
+
+def test_segment_recovery():
+    print("Starting segment recovery test...")
+    ok = True
+
+    faiss_service.add_documents(make_chunks("first.txt", ["Invoices are due within thirty days."]))
+    orphan = crash_after_publish(faiss_service, make_chunks("lost.txt", ["This upload never committed."]))
+    print(f"Published {orphan} without committing the manifest.")
+
+    # 1. The next upload reuses the uncommitted name
+    try:
+        faiss_service.add_documents(make_chunks("second.txt", ["Refunds take five business days."]))
+    except Exception as e:
+        print(f"FAILURE: Upload after the crash failed: {e}")
+        return False
+    manifest = read_manifest(faiss_service.index_path)
+    if orphan not in manifest["segments"] or faiss_service.get_file_chunk_ids("lost.txt"):
+        print(f"FAILURE: Unexpected manifest after the crash: {manifest}")
+        ok = False
+    else:
+        print("SUCCESS: Upload after the crash replaced the uncommitted segment.")
+
+    # 2. Loading the index removes segment directories the manifest does not reference
+    orphan = crash_after_publish(faiss_service, make_chunks("lost.txt", ["This upload never committed either."]))
+    reloaded = FAISSService()
+    on_disk = sorted(os.listdir(reloaded._segments_root))
+    live = [segment.name for segment in reloaded.snapshot.segments]
+    if orphan in on_disk or on_disk != sorted(live):
+        print(f"FAILURE: Segments on disk {on_disk} do not match the manifest {live}.")
+        ok = False
+    elif sorted(reloaded.list_files()) != ["first.txt", "second.txt"]:
+        print(f"FAILURE: Reloaded index lists {reloaded.list_files()}.")
+        ok = False
+    else:
+        print("SUCCESS: Reload removed the uncommitted segment.")
+
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = test_segment_recovery()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    raise SystemExit(0 if passed else 1)